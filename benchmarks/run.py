@@ -0,0 +1,289 @@
+"""Benchmark the train, tune and predict hot paths on synthetic data.
+
+Usage:
+    python benchmarks/run.py [--sizes 10000 100000 1000000] [--trials 5]
+        [--output results.json] [--compare baseline.json]
+
+Each benchmark runs in a fresh process and its throughput in rows/sec and peak
+resident memory are saved to a JSON file, so that results can be compared between
+commits with `--compare`.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+# keep benchmarks quiet unless asked otherwise
+os.environ.setdefault("VERBOSITY", "0")
+
+import synthetic  # noqa: E402
+
+from src import config  # noqa: E402
+from src.models import models  # noqa: E402
+from src.preprocessors import preprocessors  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+DEFAULT_PREPROCESSOR = "c4"
+
+
+def get_peak_rss() -> float:
+    """Get the peak resident memory of the current process in MB"""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak_rss / 1024**2 if sys.platform == "darwin" else peak_rss / 1024
+
+
+def run_case(
+    kind: str, name: str, train_path: Path, test_path: Path, n_trials: int
+) -> dict:
+    """Run a single benchmark in the current process"""
+    from sklearn.base import clone
+
+    from src import cv, data, predict
+
+    def load_train():
+        train_df = data.load_data(train_path)
+        return train_df.drop(config.TARGET_COL, axis=1), train_df[config.TARGET_COL]
+
+    # set up the benchmark outside of the timed section
+    n_rows = None
+    if kind == "load_csv":
+
+        def func():
+            return data.read_csv(train_path)
+
+    elif kind == "load_cache":
+        data.load_data(train_path)
+
+        def func():
+            return data.load_data(train_path)
+
+    elif kind == "preprocess":
+        X, y = load_train()
+
+        def func():
+            preprocessor = clone(preprocessors[name])
+            preprocessor.fit_transform(X, y)
+            return preprocessor.transform(X)
+
+    elif kind == "datetime":
+        from feature_engine.datetime import DatetimeFeatures
+
+        from src.preprocessors import DATETIME_FEATURES
+        from src.transformers import CalendarFeatures
+
+        X, y = load_train()
+        X = X[["PURCHASED_AT"]]
+        transformers = {
+            "feature_engine": DatetimeFeatures,
+            "calendar": CalendarFeatures,
+        }
+        transformer = transformers[name](features_to_extract=DATETIME_FEATURES)
+
+        def func():
+            return transformer.fit(X).transform(X)
+
+    elif kind == "fit":
+        X, y = load_train()
+        X = clone(preprocessors[DEFAULT_PREPROCESSOR]).fit_transform(X, y)
+
+        def func():
+            return clone(models[name]).fit(X, y)
+
+    elif kind == "cv":
+        X, y = load_train()
+        model, preprocessor = name.split("+")
+
+        def func():
+            return cv.cross_validate(model, preprocessor, X, y)
+
+    elif kind == "tune":
+        import optuna
+
+        from src import tune
+
+        X, y = load_train()
+        model, preprocessor = name.split("+")
+        objective = tune.create_objective(
+            model, preprocessor, train_path, os.cpu_count()
+        )
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+        def func():
+            # rows are processed once per trial
+            study = optuna.create_study(
+                sampler=optuna.samplers.RandomSampler(seed=config.RANDOM_SEED),
+                pruner=optuna.pruners.NopPruner(),
+            )
+            study.optimize(objective, n_trials=n_trials)
+
+        n_rows = len(y) * n_trials
+
+    elif kind == "predict":
+        X, y = load_train()
+        model, preprocessor = name.split("+")
+        estimators = cv.cross_validate(model, preprocessor, X, y)["estimator"]
+        groups = predict.group_estimators(estimators)
+        test_df = data.load_data(test_path)
+        n_rows = len(test_df)
+
+        def func():
+            return predict.predict_frame(groups, test_df)
+
+    else:
+        raise ValueError(f"Unknown benchmark {kind!r}")
+
+    rss_before = get_peak_rss()
+    start_time = time.perf_counter()
+    result = func()
+    run_time = time.perf_counter() - start_time
+
+    if n_rows is None:
+        n_rows = len(result) if kind.startswith("load") else len(y)
+    return {
+        "seconds": run_time,
+        "rows_per_sec": n_rows / run_time,
+        "peak_rss_mb": get_peak_rss(),
+        "setup_peak_rss_mb": rss_before,
+    }
+
+
+def get_cases(args: argparse.Namespace) -> list:
+    """Get the benchmarks to run"""
+    cases = [("load_csv", ""), ("load_cache", "")]
+    cases += [("datetime", "feature_engine"), ("datetime", "calendar")]
+    cases += [("preprocess", name) for name in args.preprocessors]
+    cases += [("fit", name) for name in args.models]
+    cases += [("cv", f"{name}+{DEFAULT_PREPROCESSOR}") for name in args.cv_models]
+    cases += [("tune", f"{name}+{DEFAULT_PREPROCESSOR}") for name in args.tune_models]
+    cases += [("predict", f"{name}+{DEFAULT_PREPROCESSOR}") for name in args.cv_models]
+    return cases
+
+
+def get_commit() -> str:
+    """Get the current git commit"""
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() or "unknown"
+
+
+def compare(results: list, baseline_file: Path) -> None:
+    """Print the speedup of each benchmark over a baseline"""
+    with open(baseline_file) as file:
+        baseline = json.load(file)
+
+    baseline_results = {
+        (r["benchmark"], r["n_rows"]): r
+        for r in baseline["results"]
+        if "error" not in r
+    }
+    print(f"\nComparison with {baseline['commit']} (> 1 is faster):")
+    for result in results:
+        key = (result["benchmark"], result["n_rows"])
+        if "error" in result or key not in baseline_results:
+            continue
+        speedup = result["rows_per_sec"] / baseline_results[key]["rows_per_sec"]
+        memory = result["peak_rss_mb"] / baseline_results[key]["peak_rss_mb"]
+        print(f"{key[0]:>30} {key[1]:>9}: {speedup:6.2f}x speed {memory:6.2f}x memory")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument(
+        "--preprocessors", nargs="+", default=list(preprocessors.keys())
+    )
+    parser.add_argument("--models", nargs="+", default=list(models.keys()))
+    parser.add_argument("--cv-models", nargs="+", default=["dt", "lgb"])
+    parser.add_argument("--tune-models", nargs="+", default=["lgb"])
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+
+    commit = get_commit()
+    output = args.output or config.OUTPUT_DIR / "benchmarks" / f"{commit}.json"
+    cases = get_cases(args)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # the caches, including the results of tuning trials, are cleared after
+        # each benchmark, so that every benchmark starts with cold caches
+        cache_dir = Path(tmp_dir) / "cache"
+        os.environ["CACHE_DIR"] = str(cache_dir)
+        os.environ["TRIAL_STORE"] = str(cache_dir / "trials.db")
+
+        for n_rows in args.sizes:
+            train_path = Path(tmp_dir) / f"train_{n_rows}.csv"
+            test_path = Path(tmp_dir) / f"test_{n_rows}.csv"
+            synthetic.write_csv(n_rows, train_path)
+            synthetic.write_csv(n_rows, test_path, with_target=False)
+
+            for kind, name in cases:
+                benchmark = f"{kind}:{name}" if name else kind
+                result = {"benchmark": benchmark, "n_rows": n_rows}
+
+                # run each benchmark in a fresh process to isolate its memory usage
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    future = executor.submit(
+                        run_case, kind, name, train_path, test_path, args.trials
+                    )
+                    try:
+                        result.update(future.result())
+                    except Exception as exc:
+                        result["error"] = repr(exc)
+                shutil.rmtree(cache_dir, ignore_errors=True)
+
+                results.append(result)
+                if "error" in result:
+                    print(f"{benchmark:>30} {n_rows:>9}: {result['error']}")
+                else:
+                    print(
+                        f"{benchmark:>30} {n_rows:>9}: "
+                        f"{result['rows_per_sec']:12.1f} rows/sec "
+                        f"{result['peak_rss_mb']:9.1f} MB"
+                    )
+
+    # save the results in a machine-readable format
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(
+            {
+                "commit": commit,
+                "timestamp": datetime.datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark the startup time of the CLI and guard against regressions.
+
+Usage:
+    python benchmarks/startup.py [--repeat 5] [--max-seconds 1.0]
+
+Exits with a non-zero status if the median time of `cli.py predict --help` exceeds
+the limit, if importing the CLI imports any of the heavy dependencies, or if
+importing the modules of a command imports model backends it only needs for some
+models.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+
+HEAVY_MODULES = [
+    "catboost",
+    "feature_engine",
+    "lightgbm",
+    "mlflow",
+    "optuna",
+    "pandas",
+    "sklearn",
+    "sklego",
+    "xgboost",
+]
+
+# the model backends, which are imported when a model is selected
+BACKEND_MODULES = ["catboost", "lightgbm", "xgboost"]
+
+# the dependencies that importing the modules of a command mustn't import
+COMMAND_MODULES = {
+    "src.train": [*BACKEND_MODULES, "optuna"],
+    "src.sweep": [*BACKEND_MODULES, "optuna"],
+    "src.tune": BACKEND_MODULES,
+}
+
+
+def time_command(command: list, repeat: int) -> float:
+    """Get the median wall time of a command"""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(command, cwd=BASE_DIR, check=True, capture_output=True)
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+
+def get_heavy_imports(module="src.cli", heavy_modules=None) -> list:
+    """Get the heavy modules imported by a module, the CLI by default"""
+    if heavy_modules is None:
+        heavy_modules = HEAVY_MODULES
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {heavy_modules!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BASE_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    command = [sys.executable, "-m", "src.cli", "predict", "--help"]
+    run_time = time_command(command, args.repeat)
+    print(f"cli.py predict --help: {run_time:.3f} seconds (median of {args.repeat})")
+
+    heavy_imports = get_heavy_imports()
+    if heavy_imports:
+        print(f"Heavy modules imported at startup: {', '.join(heavy_imports)}")
+
+    command_imports = {}
+    for module, heavy_modules in COMMAND_MODULES.items():
+        command_imports[module] = get_heavy_imports(module, heavy_modules)
+        if command_imports[module]:
+            print(f"Modules imported by {module}: {', '.join(command_imports[module])}")
+
+    if run_time > args.max_seconds or heavy_imports or any(command_imports.values()):
+        print("Startup time regression")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
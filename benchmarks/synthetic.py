@@ -0,0 +1,91 @@
+"""Synthetic transactions with the same schema as the competition data"""
+
+import numpy as np
+import pandas as pd
+
+from src import config
+
+CATEGORIES = [
+    "Bills & Fees",
+    "Data & WiFi",
+    "Education",
+    "Emergency fund",
+    "Family & Friends",
+    "Going out",
+    "Groceries",
+    "Health",
+    "Loan Repayment",
+    "Miscellaneous",
+    "Rent / Mortgage",
+    "Shopping",
+    "Transport & Fuel",
+]
+
+MERCHANT_WORDS = [
+    "bar",
+    "butchery",
+    "cafe",
+    "chemist",
+    "clinic",
+    "electronics",
+    "hotel",
+    "kplc",
+    "naivas",
+    "petrol",
+    "restaurant",
+    "safaricom",
+    "school",
+    "shop",
+    "supermarket",
+    "uber",
+]
+
+
+def generate(n_rows: int, with_target=True, seed=config.RANDOM_SEED) -> pd.DataFrame:
+    """Generate synthetic transactions"""
+    rng = np.random.default_rng(seed)
+    n_users = max(10, n_rows // 50)
+    n_merchants = max(10, n_rows // 20)
+
+    # merchant names made up of a few words and a branch number
+    words = rng.choice(MERCHANT_WORDS, size=(n_merchants, 2))
+    merchants = np.array(
+        [f"{first} {second} {i}" for i, (first, second) in enumerate(words)]
+    )
+
+    purchased_at = pd.Timestamp("2022-01-01") + pd.to_timedelta(
+        rng.integers(0, 365 * 24 * 3600, n_rows), unit="s"
+    )
+    categorized_at = purchased_at + pd.to_timedelta(
+        rng.integers(0, 30 * 24 * 3600, n_rows), unit="s"
+    )
+
+    df = pd.DataFrame(
+        {
+            config.INDEX_COL: [f"ID_{i:010d}" for i in range(n_rows)],
+            "MERCHANT_CATEGORIZED_AT": categorized_at,
+            "MERCHANT_NAME": merchants[rng.zipf(1.5, n_rows) % n_merchants],
+            "PURCHASED_AT": purchased_at,
+            "IS_PURCHASE_PAID_VIA_MPESA_SEND_MONEY": rng.random(n_rows) < 0.3,
+            "PURCHASE_VALUE": rng.lognormal(6, 1.5, n_rows).round(),
+            "USER_AGE": np.where(
+                rng.random(n_rows) < 0.2, np.nan, rng.integers(18, 70, n_rows)
+            ),
+            "USER_GENDER": rng.choice(
+                np.array(["Male", "Female", None], dtype=object),
+                n_rows,
+                p=[0.5, 0.4, 0.1],
+            ),
+            "USER_HOUSEHOLD": rng.integers(1, 8, n_rows),
+            "USER_INCOME": rng.lognormal(10, 1, n_rows).round(),
+            "USER_ID": [f"ID_{i:06d}" for i in rng.integers(0, n_users, n_rows)],
+        }
+    )
+    if with_target:
+        df[config.TARGET_COL] = rng.choice(CATEGORIES, n_rows)
+    return df
+
+
+def write_csv(n_rows: int, path, with_target=True) -> None:
+    """Write synthetic transactions to a CSV file"""
+    generate(n_rows, with_target).to_csv(path, index=False)
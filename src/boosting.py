@@ -0,0 +1,267 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.model_selection import train_test_split
+
+from . import config
+
+# parameters that set the number of boosting iterations of each model
+iteration_params = {
+    "xgb": "n_estimators",
+    "cb": "iterations",
+    "lgb": "n_estimators",
+    "hgb": "max_iter",
+}
+
+
+def supports_early_stopping(model: str) -> bool:
+    """Check whether a model supports early stopping."""
+    return model in iteration_params
+
+
+def supports_pruning(model: str) -> bool:
+    """Check whether a model can report its iterations to an Optuna trial."""
+    if model == "cb":
+        import optuna
+
+        # the CatBoost pruning callback requires optuna>=3.0
+        return hasattr(optuna.integration, "CatBoostPruningCallback")
+    return model in ("xgb", "lgb")
+
+
+def split_eval_set(X, y) -> tuple:
+    """Hold out a stratified evaluation set from the training data."""
+    fit_idx, eval_idx = train_test_split(
+        np.arange(len(y)),
+        test_size=config.EARLY_STOPPING_FRACTION,
+        stratify=y,
+        random_state=config.RANDOM_SEED,
+    )
+    if hasattr(X, "iloc"):
+        return X.iloc[fit_idx], X.iloc[eval_idx], y.iloc[fit_idx], y.iloc[eval_idx]
+    return X[fit_idx], X[eval_idx], y.iloc[fit_idx], y.iloc[eval_idx]
+
+
+def fit(model: str, estimator, X, y, trial=None):
+    """Fit a boosted model with early stopping on a held out evaluation set.
+
+    If a trial is given, the evaluation log loss of each iteration is reported to
+    it so that unpromising trials are pruned while boosting.
+    """
+    rounds = config.EARLY_STOPPING_ROUNDS
+    if trial is not None:
+        import optuna
+    if model != "hgb":
+        X, X_eval, y, y_eval = split_eval_set(X, y)
+
+    if model == "xgb":
+        callbacks = []
+        if trial is not None:
+            callbacks.append(
+                optuna.integration.XGBoostPruningCallback(
+                    trial, "validation_0-mlogloss"
+                )
+            )
+        estimator.set_params(
+            early_stopping_rounds=rounds, eval_metric="mlogloss", callbacks=callbacks
+        )
+        estimator.fit(X, y, eval_set=[(X_eval, y_eval)], verbose=False)
+
+        # don't keep a reference to the trial in the fitted model
+        estimator.set_params(callbacks=None)
+    elif model == "lgb":
+        import lightgbm
+
+        callbacks = [lightgbm.early_stopping(rounds, verbose=False)]
+        if trial is not None:
+            callbacks.append(
+                optuna.integration.LightGBMPruningCallback(trial, "multi_logloss")
+            )
+        estimator.fit(
+            X,
+            y,
+            eval_set=[(X_eval, y_eval)],
+            eval_metric="multi_logloss",
+            callbacks=callbacks,
+        )
+    elif model == "cb":
+        callbacks = None
+        if trial is not None and supports_pruning(model):
+            callbacks = [
+                optuna.integration.CatBoostPruningCallback(trial, "MultiClass")
+            ]
+        estimator.fit(
+            X,
+            y,
+            eval_set=(X_eval, y_eval),
+            early_stopping_rounds=rounds,
+            callbacks=callbacks,
+        )
+        if callbacks:
+            callbacks[0].check_pruned()
+    elif model == "hgb":
+        # holds out its own evaluation set as there is no evaluation set API
+        estimator.set_params(
+            early_stopping=True,
+            n_iter_no_change=rounds,
+            validation_fraction=config.EARLY_STOPPING_FRACTION,
+            scoring="loss",
+        )
+        estimator.fit(X, y)
+    else:
+        raise ValueError(f"Early stopping is not supported for {model!r}")
+    return estimator
+
+
+def get_best_iteration(model: str, estimator) -> int:
+    """Get the number of boosting iterations of the best model."""
+    if model == "xgb":
+        return estimator.best_iteration + 1
+    if model == "lgb":
+        return estimator.best_iteration_ or estimator.n_estimators
+    if model == "cb":
+        return estimator.get_best_iteration() + 1
+    if model == "hgb":
+        return estimator.n_iter_
+    raise ValueError(f"Early stopping is not supported for {model!r}")
+
+
+def supports_warm_start(model: str) -> bool:
+    """Check whether a fitted model can be trained further on new data."""
+    return model in iteration_params or model == "rf"
+
+
+def pad_classes(X, y, classes) -> tuple:
+    """Add a row with zero weight for each class that isn't in the new data.
+
+    A fold's share of a small batch of new data often misses some classes, which
+    the model must still see to keep its classes. The rows copy the first row of
+    `X`, so they don't change the fit. Returns the data and the sample weights.
+    """
+    missing_classes = np.setdiff1d(classes, np.unique(y))
+    sample_weight = np.concatenate([np.ones(len(y)), np.zeros(len(missing_classes))])
+    if not len(missing_classes):
+        return X, y, sample_weight
+
+    first_rows = [0] * len(missing_classes)
+    if isinstance(X, pd.DataFrame):
+        X = pd.concat([X, X.iloc[first_rows]])
+    elif sparse.issparse(X):
+        X = sparse.vstack([X, X[first_rows]], format=X.format)
+    else:
+        X = np.concatenate([X, X[first_rows]])
+    if isinstance(y.dtype, pd.CategoricalDtype):
+        # the categories of the new data are only the classes it has
+        new_categories = np.setdiff1d(missing_classes, y.cat.categories)
+        y = y.cat.add_categories(new_categories)
+    y = pd.concat([y, pd.Series(missing_classes, dtype=y.dtype, name=y.name)])
+    return X, y, sample_weight
+
+
+def continue_fit(model: str, estimator, X, y, n_iterations: int):
+    """Train a fitted model further on new data.
+
+    Boosted models continue boosting from their trees for `n_iterations` iterations,
+    while random forests add `n_iterations` trees fitted on the new data. Returns
+    the trained model, which is a new model for CatBoost.
+    """
+    if isinstance(estimator, BoosterClassifier):
+        raise ValueError(
+            "Incremental training of boosters trained out of core is not supported"
+        )
+    unknown_classes = set(np.unique(y)) - set(estimator.classes_)
+    if unknown_classes:
+        raise ValueError(
+            f"The new data has classes unknown to the model: {unknown_classes}"
+        )
+    X, y, sample_weight = pad_classes(X, y, estimator.classes_)
+
+    if model == "xgb":
+        booster = estimator.get_booster()
+        estimator.set_params(n_estimators=n_iterations, early_stopping_rounds=None)
+        estimator.fit(
+            X, y, sample_weight=sample_weight, xgb_model=booster, verbose=False
+        )
+    elif model == "lgb":
+        booster = estimator.booster_
+        estimator.set_params(n_estimators=n_iterations)
+        estimator.fit(X, y, sample_weight=sample_weight, init_model=booster)
+    elif model == "cb":
+        # CatBoost crashes when boosting from a model with categorical features
+        if estimator.get_params().get("cat_features"):
+            raise ValueError(
+                "Incremental training of CatBoost models with categorical features "
+                "is not supported"
+            )
+
+        # fitted CatBoost models can't be modified, so a new model is boosted
+        init_model = estimator
+        estimator = clone(init_model).set_params(iterations=n_iterations)
+        estimator.fit(X, y, sample_weight=sample_weight, init_model=init_model)
+    elif model == "hgb":
+        estimator.set_params(
+            warm_start=True,
+            early_stopping=False,
+            max_iter=estimator.n_iter_ + n_iterations,
+        )
+        estimator.fit(X, y, sample_weight=sample_weight)
+    elif model == "rf":
+        estimator.set_params(
+            warm_start=True, n_estimators=len(estimator.estimators_) + n_iterations
+        )
+        estimator.fit(X, y, sample_weight=sample_weight)
+    else:
+        raise ValueError(f"Incremental training is not supported for {model!r}")
+    return estimator
+
+
+class BoosterClassifier(ClassifierMixin, BaseEstimator):
+    """Classifier wrapping a multiclass XGBoost or LightGBM booster.
+
+    Boosters trained with the native APIs, e.g. on data streamed from disk, are
+    wrapped so that they can be used in pipelines like the other models.
+    """
+
+    def __init__(self, booster=None, classes=None):
+        self.booster = booster
+        self.classes = classes
+
+    @property
+    def classes_(self) -> np.ndarray:
+        return np.asarray(self.classes)
+
+    def fit(self, X, y):
+        raise ValueError(
+            "Boosters trained out of core can't be refitted, they are trained on "
+            "data streamed from disk by `streaming.cross_validate`"
+        )
+
+    def predict_proba(self, X) -> np.ndarray:
+        if type(self.booster).__module__.startswith("xgboost"):
+            import xgboost
+
+            return self.booster.predict(xgboost.DMatrix(X))
+        return self.booster.predict(X)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def get_booster_params(model: str, estimator, n_classes: int) -> dict:
+    """Get the native parameters of a multiclass XGBoost or LightGBM classifier."""
+    if model == "xgb":
+        params = estimator.get_xgb_params()
+        params.update(objective="multi:softprob", num_class=n_classes)
+
+        # external memory requires the histogram or approximate tree methods
+        if params.get("tree_method") not in ("hist", "approx"):
+            params["tree_method"] = "hist"
+    elif model == "lgb":
+        params = estimator.get_params()
+        for param in ("class_weight", "importance_type", "n_estimators", "silent"):
+            params.pop(param, None)
+        params.update(objective="multiclass", num_class=n_classes)
+    else:
+        raise ValueError(f"Native boosting is not supported for {model!r}")
+    return {param: value for param, value in params.items() if value is not None}
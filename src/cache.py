@@ -0,0 +1,87 @@
+import inspect
+import logging
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+
+from . import config, preprocessors, profiling, transformers
+
+# logger
+logger = logging.getLogger(__name__)
+
+memory = joblib.Memory(config.TRANSFORM_CACHE_DIR, mmap_mode="r", verbose=0)
+
+
+def get_version(name: str) -> str:
+    """Hash the definition of a preprocessor and the source of the transformers"""
+    source = inspect.getsource(transformers)
+    return joblib.hash((preprocessors.preprocessors[name], source))
+
+
+def _fit_transform_fold(
+    name: str,
+    version: str,
+    data_hash: str,
+    train_idx: np.ndarray,
+    val_idx: np.ndarray,
+    X: pd.DataFrame,
+    y: pd.Series,
+) -> tuple:
+    """Fit a preprocessor on a training fold and transform both folds"""
+    logger.info(f"Fitting preprocessor {name!r} on a fold of {len(train_idx)} rows")
+    preprocessor = clone(preprocessors.preprocessors[name])
+    with profiling.span("fit_transform"):
+        X_train = preprocessor.fit_transform(X.iloc[train_idx], y.iloc[train_idx])
+    with profiling.span("transform"):
+        X_val = preprocessor.transform(X.iloc[val_idx])
+
+    # the column transformers run in parallel, so they are timed separately
+    if config.PROFILE:
+        profile_columns(preprocessor, X.iloc[train_idx], y.iloc[train_idx])
+    return preprocessor, X_train, X_val
+
+
+def profile_columns(preprocessor, X: pd.DataFrame, y: pd.Series) -> None:
+    """Record a span for the fit and transform of each column transformer"""
+    with profiling.span("columns"):
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer in ("drop", "passthrough"):
+                continue
+            with profiling.span(name):
+                with profiling.span("fit"):
+                    transformer = clone(transformer).fit(X[columns], y)
+                with profiling.span("transform"):
+                    transformer.transform(X[columns])
+
+
+_cached_fit_transform_fold = memory.cache(_fit_transform_fold, ignore=["X", "y"])
+
+
+def fit_transform_fold(
+    name: str,
+    X: pd.DataFrame,
+    y: pd.Series,
+    train_idx: np.ndarray,
+    val_idx: np.ndarray,
+    data_hash: str,
+) -> tuple:
+    """Obtain a fitted preprocessor and the transformed folds from the cache.
+
+    The cache is keyed on the preprocessor name and version, the fold indices and
+    the hash of the data, so only the first call for a fold pays the preprocessing
+    cost, and changes to the preprocessor don't reuse stale results.
+    """
+    return _cached_fit_transform_fold(
+        name, get_version(name), data_hash, train_idx, val_idx, X, y
+    )
+
+
+def evict() -> None:
+    """Evict the least recently used entries beyond the size of the cache.
+
+    This is called once the folds of a command are fitted, not by the fold workers,
+    which could evict the entries that other workers are still writing.
+    """
+    memory.reduce_size(bytes_limit=config.TRANSFORM_CACHE_SIZE)
@@ -1,15 +1,14 @@
 import argparse
 
+from . import config
 from .models import models
-from .params import param_distributions
-from .predict import predict
+from .params import param_distributions, pruners, samplers
 from .preprocessors import preprocessors
-from .train import train
-from .tune import samplers, tune
-from .utils import configure_mlflow
+
+# the modules implementing the commands are imported by their callbacks, so that
+# heavy dependencies are only imported when a command runs
 
 
-@configure_mlflow
 def main():
     """Main function for the CLI"""
     # create the main parser
@@ -20,19 +19,41 @@ def main():
     parse_train(subparsers)
     parse_predict(subparsers)
     parse_tune(subparsers)
+    parse_serve(subparsers)
+    parse_update(subparsers)
+    parse_export(subparsers)
+    parse_sweep(subparsers)
 
     # parse the arguments from the command line and call the callback function
     args = parser.parse_args()
-    args.func(args)
+    config.configure_logging()
+
+    from .profiling import profile_run
+    from .utils import configure_mlflow
+
+    # every command carries a breakdown of where its time is spent
+    with profile_run(args.action):
+        configure_mlflow(args.func)(args)
 
 
 def train_callback(args: argparse.Namespace):
     """Callback function for the train command"""
-    train(model=args.model, preprocessor=args.preprocessor, data_path=args.file)
+    from .train import train
+
+    train(
+        model=args.model,
+        preprocessor=args.preprocessor,
+        data_path=args.file,
+        tuned_run_id=args.tuned_run_id,
+        chunksize=args.chunksize,
+        single_model=args.single_model,
+    )
 
 
 def tune_callback(args: argparse.Namespace):
     """Callback function for the tune command"""
+    from .tune import tune
+
     tune(
         model=args.model,
         preprocessor=args.preprocessor,
@@ -40,12 +61,74 @@ def tune_callback(args: argparse.Namespace):
         n_trials=args.trials,
         timeout=args.timeout,
         sampler=args.sampler,
+        pruner=args.pruner,
+        n_workers=args.workers,
+        n_cores=args.cores,
+        halving=args.halving,
     )
 
 
 def predict_callback(args: argparse.Namespace):
     """Callback function for the predict command"""
-    predict(run_id=args.run_id, data_path=args.file, proba=args.proba)
+    from .predict import predict
+
+    predict(
+        run_id=args.run_id,
+        data_path=args.file,
+        proba=args.proba,
+        chunksize=args.chunksize,
+        output_format=args.output_format,
+        n_jobs=args.workers,
+        mode=args.mode,
+        compare=args.compare_modes,
+    )
+
+
+def serve_callback(args: argparse.Namespace):
+    """Callback function for the serve command"""
+    from .serve import serve
+
+    serve(
+        run_id=args.run_id,
+        host=args.host,
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait,
+        n_jobs=args.workers,
+    )
+
+
+def update_callback(args: argparse.Namespace):
+    """Callback function for the update command"""
+    from .update import update
+
+    update(run_id=args.run_id, data_path=args.file, n_iterations=args.iterations)
+
+
+def export_callback(args: argparse.Namespace):
+    """Callback function for the export command"""
+    from .export import export
+
+    export(
+        run_id=args.run_id,
+        backend=args.backend,
+        data_path=args.file,
+        n_repeats=args.repeat,
+        tolerance=args.tolerance,
+    )
+
+
+def sweep_callback(args: argparse.Namespace):
+    """Callback function for the sweep command"""
+    from .sweep import sweep
+
+    sweep(
+        model_names=args.models,
+        preprocessor_names=args.preprocessors,
+        data_path=args.file,
+        n_workers=args.workers,
+        n_cores=args.cores,
+    )
 
 
 def parse_train(subparsers: argparse.ArgumentParser):
@@ -68,6 +151,24 @@ def parse_train(subparsers: argparse.ArgumentParser):
     parser_train.add_argument(
         "-f", "--file", type=str, help="path to the file containing the data"
     )
+    parser_train.add_argument(
+        "-t",
+        "--tuned-run-id",
+        type=str,
+        help="MLflow run id of a tuning run whose best hyperparameters are used",
+    )
+    parser_train.add_argument(
+        "--chunksize",
+        type=int,
+        help="stream the data from disk in chunks of this many rows (lgb and xgb)",
+    )
+    parser_train.add_argument(
+        "--single-model",
+        type=str,
+        choices=("full", "distilled"),
+        help="also save a single model fitted on the full data or distilled from "
+        "the fold models",
+    )
 
     # add the callback for the train command
     parser_train.set_defaults(func=train_callback)
@@ -109,6 +210,29 @@ def parse_tune(subparsers: argparse.ArgumentParser):
         choices=samplers.keys(),
         help="sampler to use",
     )
+    parser_tune.add_argument(
+        "--pruner",
+        type=str,
+        default="median",
+        choices=pruners.keys(),
+        help="pruner used to stop unpromising trials after each fold",
+    )
+    parser_tune.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes running trials in parallel",
+    )
+    parser_tune.add_argument(
+        "--cores",
+        type=int,
+        help="total number of cores shared by the workers (default: all)",
+    )
+    parser_tune.add_argument(
+        "--halving",
+        action="store_true",
+        help="evaluate trials on growing fractions of the rows, promoting the best",
+    )
 
     # add the callback for the tune command
     parser_tune.set_defaults(func=tune_callback)
@@ -134,10 +258,190 @@ def parse_predict(subparsers: argparse.ArgumentParser):
     parser_predict.add_argument(
         "-f", "--file", type=str, help="path to the file containing the data"
     )
+    parser_predict.add_argument(
+        "--chunksize",
+        type=int,
+        help="stream predictions on chunks of this many rows to bound memory usage",
+    )
+    parser_predict.add_argument(
+        "--output-format",
+        type=str,
+        default="csv",
+        choices=("csv", "parquet"),
+        help="format of the file the predictions are saved to",
+    )
+    parser_predict.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of threads running the fold models concurrently",
+    )
+    parser_predict.add_argument(
+        "--mode",
+        type=str,
+        default="ensemble",
+        choices=("ensemble", "single"),
+        help="predict with the fold models or the single model of the run",
+    )
+    parser_predict.add_argument(
+        "--compare-modes",
+        action="store_true",
+        help="report the log loss and speed of both modes on labelled data",
+    )
 
     # add the callback for the predict command
     parser_predict.set_defaults(func=predict_callback)
 
 
+def parse_serve(subparsers: argparse.ArgumentParser):
+    """Subparser for the serve command"""
+    parser_serve = subparsers.add_parser(
+        "serve", help="serve predictions over HTTP/JSON"
+    )
+    parser_serve.add_argument(
+        "-r",
+        "--run-id",
+        type=str,
+        required=True,
+        help="MLflow run id",
+    )
+    parser_serve.add_argument(
+        "--host", type=str, default="127.0.0.1", help="host to listen on"
+    )
+    parser_serve.add_argument(
+        "--port", type=int, default=8000, help="port to listen on"
+    )
+    parser_serve.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=64,
+        help="maximum number of transactions predicted together",
+    )
+    parser_serve.add_argument(
+        "--max-wait",
+        type=float,
+        default=5,
+        help="maximum number of milliseconds to wait for a batch to fill up",
+    )
+    parser_serve.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of threads running the fold models concurrently",
+    )
+
+    # add the callback for the serve command
+    parser_serve.set_defaults(func=serve_callback)
+
+
+def parse_update(subparsers: argparse.ArgumentParser):
+    """Subparser for the update command"""
+    parser_update = subparsers.add_parser(
+        "update", help="train the models of a run further on new data"
+    )
+    parser_update.add_argument(
+        "-r",
+        "--run-id",
+        type=str,
+        required=True,
+        help="MLflow run id of the models to update",
+    )
+    parser_update.add_argument(
+        "-f",
+        "--file",
+        type=str,
+        required=True,
+        help="path to the file containing the new data",
+    )
+    parser_update.add_argument(
+        "--iterations",
+        type=int,
+        default=100,
+        help="number of boosting iterations, or trees for random forests, to add",
+    )
+
+    # add the callback for the update command
+    parser_update.set_defaults(func=update_callback)
+
+
+def parse_export(subparsers: argparse.ArgumentParser):
+    """Subparser for the export command"""
+    parser_export = subparsers.add_parser(
+        "export", help="compile the models of a run for fast inference"
+    )
+    parser_export.add_argument(
+        "-r",
+        "--run-id",
+        type=str,
+        required=True,
+        help="MLflow run id of the models to export",
+    )
+    parser_export.add_argument(
+        "--backend",
+        type=str,
+        default="native",
+        choices=("native", "treelite", "onnx"),
+        help="format the models are compiled to",
+    )
+    parser_export.add_argument(
+        "-f",
+        "--file",
+        type=str,
+        help="path to the file the compiled models are verified and timed on",
+    )
+    parser_export.add_argument(
+        "--repeat", type=int, default=3, help="number of timed prediction runs"
+    )
+    parser_export.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-5,
+        help="maximum difference from the probabilities of the original models",
+    )
+
+    # add the callback for the export command
+    parser_export.set_defaults(func=export_callback)
+
+
+def parse_sweep(subparsers: argparse.ArgumentParser):
+    """Subparser for the sweep command"""
+    parser_sweep = subparsers.add_parser(
+        "sweep", help="cross-validate combinations of models and preprocessors"
+    )
+    parser_sweep.add_argument(
+        "-m",
+        "--models",
+        type=str,
+        nargs="+",
+        required=True,
+        choices=models.keys(),
+    )
+    parser_sweep.add_argument(
+        "-p",
+        "--preprocessors",
+        type=str,
+        nargs="+",
+        required=True,
+        choices=preprocessors.keys(),
+    )
+    parser_sweep.add_argument(
+        "-f", "--file", type=str, help="path to the file containing the data"
+    )
+    parser_sweep.add_argument(
+        "--workers",
+        type=int,
+        help="number of worker processes fitting folds in parallel "
+        "(default: one per core)",
+    )
+    parser_sweep.add_argument(
+        "--cores",
+        type=int,
+        help="total number of cores shared by the workers (default: all)",
+    )
+
+    # add the callback for the sweep command
+    parser_sweep.set_defaults(func=sweep_callback)
+
+
 if __name__ == "__main__":
     main()
@@ -2,7 +2,6 @@ from logging.config import dictConfig
 from pathlib import Path
 
 import decouple
-from sklearn import model_selection
 
 # file paths
 BASE_DIR = Path(__file__).parent.parent
@@ -23,6 +22,17 @@ TARGET_COL = "MERCHANT_CATEGORIZED_AS"
 
 DATETIME_COLS = ["MERCHANT_CATEGORIZED_AT", "PURCHASED_AT"]
 
+CATEGORICAL_COLS = ["MERCHANT_NAME", "USER_GENDER", "USER_ID", TARGET_COL]
+
+# numeric columns are downcast to the smallest dtype that holds their values
+NUMERIC_COLS = [
+    "IS_PURCHASE_PAID_VIA_MPESA_SEND_MONEY",
+    "PURCHASE_VALUE",
+    "USER_AGE",
+    "USER_HOUSEHOLD",
+    "USER_INCOME",
+]
+
 # project details
 PROJECT_NAME = "alvin-smcc"
 
@@ -32,22 +42,65 @@ RANDOM_SEED = 98765
 # cross validation
 NUM_FOLDS = decouple.config("NUM_FOLDS", cast=int, default=2)
 
-CV_SPLITTER = model_selection.StratifiedKFold(
-    n_splits=NUM_FOLDS, shuffle=True, random_state=RANDOM_SEED
-)
+# `CV_SPLITTER` is created on first use by `__getattr__` at the end of this module
 
 # metrics
 EVAL_METRICS = ("neg_log_loss",)
 
+# early stopping of boosted models during tuning
+EARLY_STOPPING_ROUNDS = decouple.config("EARLY_STOPPING_ROUNDS", cast=int, default=50)
+
+EARLY_STOPPING_FRACTION = 0.1
+
+# multi-fidelity tuning evaluates trials on growing stratified fractions of the
+# rows and promotes the best `1 / HALVING_FACTOR` of each rung to the next one
+HALVING_FRACTIONS = decouple.config(
+    "HALVING_FRACTIONS", cast=decouple.Csv(float), default="0.05,0.2,1"
+)
+
+HALVING_FACTOR = decouple.config("HALVING_FACTOR", cast=int, default=3)
+
+# number of folds of the subsampled rungs
+HALVING_NUM_FOLDS = 2
+
+# out-of-core training fits the preprocessors on a random sample of the rows
+OUT_OF_CORE_SAMPLE_SIZE = decouple.config(
+    "OUT_OF_CORE_SAMPLE_SIZE", cast=int, default=100_000
+)
+
+# sparse features are only densified, for models that don't support them, up to
+# this many columns
+MAX_DENSE_FEATURES = decouple.config("MAX_DENSE_FEATURES", cast=int, default=10_000)
+
 # parallel jobs
 N_JOBS = decouple.config("N_JOBS", cast=int, default=-1)
 
+# caching
+CACHE_DIR = decouple.config("CACHE_DIR", cast=Path, default=OUTPUT_DIR / "cache")
+
+DATA_CACHE_DIR = CACHE_DIR / "data"
+
+TRANSFORM_CACHE_DIR = CACHE_DIR / "transforms"
+
+TRANSFORM_CACHE_SIZE = decouple.config("TRANSFORM_CACHE_SIZE", default="10G")
+
+# transformed feature matrices of runs, shared by predictions and notebooks
+FEATURE_STORE_DIR = CACHE_DIR / "features"
+
+FEATURE_STORE_SIZE = decouple.config("FEATURE_STORE_SIZE", default="10G")
+
+MODEL_CACHE_DIR = CACHE_DIR / "models"
+
+MODEL_CACHE_SIZE = decouple.config("MODEL_CACHE_SIZE", default="2G")
+
+# profiling
+PROFILE = decouple.config("PROFILE", cast=bool, default=False)
+
+PROFILE_DIR = OUTPUT_DIR / "profiles"
+
 # logging
 LOG_DIR = decouple.config("LOG_DIR", default=OUTPUT_DIR / "logs")
 
-if not LOG_DIR.exists():
-    LOG_DIR.mkdir(parents=True)  # create log directory if it doesn't exist
-
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -80,8 +133,6 @@ LOGGING = {
     },
 }
 
-dictConfig(LOGGING)
-
 VERBOSITY = decouple.config("VERBOSITY", cast=int, default=1)
 
 VERBOSE = VERBOSITY > 1
@@ -95,3 +146,28 @@ MLFLOW_TRACKING_URI = decouple.config(
 OPTUNA_DATABASE_URL = decouple.config(
     "OPTUNA_DATABASE_URL", default=f"sqlite:///{OUTPUT_DIR}/optuna.db"
 )
+
+# results of tuning trials shared between studies
+TRIAL_STORE = decouple.config(
+    "TRIAL_STORE", cast=Path, default=OUTPUT_DIR / "trials.db"
+)
+
+
+def configure_logging():
+    """Create the log directory and configure logging"""
+    if not LOG_DIR.exists():
+        LOG_DIR.mkdir(parents=True)  # create log directory if it doesn't exist
+
+    dictConfig(LOGGING)
+
+
+def __getattr__(name):
+    # the cross validation splitter is created on first use so that scikit-learn
+    # isn't imported at startup
+    if name == "CV_SPLITTER":
+        from sklearn import model_selection
+
+        return model_selection.StratifiedKFold(
+            n_splits=NUM_FOLDS, shuffle=True, random_state=RANDOM_SEED
+        )
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
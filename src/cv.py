@@ -0,0 +1,154 @@
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+from . import (
+    boosting,
+    cache,
+    config,
+    data,
+    models,
+    profiling,
+    scheduler,
+    transformers,
+)
+
+
+def get_densifier(model: str, X):
+    """Get a transformer that densifies sparse features for models that need it.
+
+    Features with more than `MAX_DENSE_FEATURES` columns, e.g. hashed n-grams, are
+    refused instead of running out of memory.
+    """
+    if model not in models.dense_models or not sparse.issparse(X):
+        return None
+    if X.shape[1] > config.MAX_DENSE_FEATURES:
+        raise ValueError(
+            f"{model!r} requires dense features, but densifying {X.shape[1]} sparse "
+            f"columns exceeds MAX_DENSE_FEATURES={config.MAX_DENSE_FEATURES}, use a "
+            f"preprocessor with fewer features"
+        )
+    return FunctionTransformer(transformers.to_dense, accept_sparse=True).fit(X)
+
+
+@profiling.profile
+def fit_fold(
+    model: str,
+    preprocessor: str,
+    X: pd.DataFrame,
+    y: pd.Series,
+    train_idx: np.ndarray,
+    val_idx: np.ndarray,
+    data_hash: str,
+    params=None,
+    early_stopping=False,
+    trial=None,
+    n_threads=None,
+) -> dict:
+    """Fit and score a pipeline on a single cross-validation fold.
+
+    If `n_threads` is given, the preprocessing and the model are limited to that
+    many threads.
+    """
+    # the preprocessing and the model share the threads of the worker
+    with scheduler.limit_threads(n_threads):
+        start_time = time.perf_counter()
+
+        # preprocessing is shared between models through the transform cache
+        with profiling.span("preprocess"):
+            transformer, X_train, X_val = cache.fit_transform_fold(
+                preprocessor, X, y, train_idx, val_idx, data_hash
+            )
+        y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
+        steps = [(preprocessor, transformer)]
+
+        densifier = get_densifier(model, X_train)
+        if densifier is not None:
+            X_train, X_val = densifier.transform(X_train), densifier.transform(X_val)
+            steps.append(("densify", densifier))
+
+        estimator = clone(models.models[model]).set_params(**(params or {}))
+        if n_threads is not None:
+            estimator.set_params(**models.get_thread_params(estimator, n_threads))
+        estimator.set_params(**models.get_categorical_params(model, estimator, X_train))
+        early_stopping = early_stopping and boosting.supports_early_stopping(model)
+        with profiling.span("fit"):
+            if early_stopping:
+                boosting.fit(model, estimator, X_train, y_train, trial)
+            else:
+                estimator.fit(X_train, y_train)
+        fit_time = time.perf_counter() - start_time
+
+        # score the model on the transformed folds
+        results = {"fit_time": fit_time}
+        if early_stopping:
+            results["best_iteration"] = boosting.get_best_iteration(model, estimator)
+
+        start_time = time.perf_counter()
+        with profiling.span("score"):
+            for metric in config.EVAL_METRICS:
+                scorer = get_scorer(metric)
+                results[f"test_{metric}"] = scorer(estimator, X_val, y_val)
+                results[f"train_{metric}"] = scorer(estimator, X_train, y_train)
+        results["score_time"] = time.perf_counter() - start_time
+
+        # combine the fitted steps into a pipeline for prediction
+        results["estimator"] = Pipeline(
+            steps + [(model, estimator)], verbose=config.VERBOSE
+        )
+        return results
+
+
+@profiling.profile
+def cross_validate(
+    model: str,
+    preprocessor: str,
+    X: pd.DataFrame,
+    y: pd.Series,
+    params=None,
+    n_cores=None,
+) -> dict:
+    """Evaluate a model and preprocessor combination with cross-validation.
+
+    The folds are fitted in parallel workers, which share the `n_cores` budget
+    (`N_JOBS` by default) between them.
+    """
+    data_hash = data.hash_frame(X, y)
+    folds = list(config.CV_SPLITTER.split(X, y))
+    allocation = scheduler.allocate(len(folds), n_cores, name="folds")
+    parallel = Parallel(n_jobs=allocation["workers"], verbose=config.VERBOSITY)
+
+    # the spans of each fold are collected in the workers and added to this process
+    fold_results = []
+    for results, spans in parallel(
+        delayed(profiling.record)(
+            fit_fold,
+            model,
+            preprocessor,
+            X,
+            y,
+            train_idx,
+            val_idx,
+            data_hash,
+            params,
+            n_threads=allocation["threads"],
+        )
+        for train_idx, val_idx in folds
+    ):
+        fold_results.append(results)
+        profiling.attach(spans)
+    cache.evict()
+
+    # aggregate the results in the same format as `sklearn.model_selection`
+    cv_results = {}
+    for key in fold_results[0]:
+        values = [result[key] for result in fold_results]
+        cv_results[key] = values if key == "estimator" else np.array(values)
+    return cv_results
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pyarrow import feather
+
+from . import config, profiling
+
+# logger
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: Path, chunk_size=2**20) -> str:
+    """Compute the SHA-256 hash of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_frame(*frames) -> str:
+    """Compute a hash of the contents of dataframes or series"""
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(pd.util.hash_pandas_object(frame).values.tobytes())
+    return digest.hexdigest()
+
+
+def downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcast numeric columns to the smallest dtype that holds their values.
+
+    Integers are downcast to the smallest integer dtype and floats to float32 if
+    no precision is lost.
+    """
+    for col in config.NUMERIC_COLS:
+        if col not in df.columns:
+            continue
+
+        values = df[col]
+        if pd.api.types.is_integer_dtype(values):
+            df[col] = pd.to_numeric(values, downcast="integer")
+        elif pd.api.types.is_float_dtype(values):
+            values_32 = values.astype(np.float32)
+            if np.array_equal(values_32, values, equal_nan=True):
+                df[col] = values_32
+    return df
+
+
+def read_csv(data_path: Path, chunksize=None):
+    """Read a CSV file with typed datetime, categorical and numeric columns.
+
+    If `chunksize` is given, an iterator over chunks of the file is returned.
+    """
+    columns = pd.read_csv(data_path, nrows=0).columns
+    parse_dates = [col for col in config.DATETIME_COLS if col in columns]
+    dtype = {col: "category" for col in config.CATEGORICAL_COLS if col in columns}
+    df = pd.read_csv(
+        data_path,
+        index_col=config.INDEX_COL,
+        parse_dates=parse_dates,
+        dtype=dtype,
+        chunksize=chunksize,
+    )
+    if chunksize:
+        return (downcast(chunk) for chunk in df)
+    return downcast(df)
+
+
+def get_content_hash(data_path: Path) -> str:
+    """Get the hash of a file's contents, which is only computed when it changes.
+
+    The hashes are indexed by the path, size and modification time of the files, so
+    repeat loads of an unchanged file don't read it.
+    """
+    index_file = config.DATA_CACHE_DIR / "index.json"
+    index = json.loads(index_file.read_text()) if index_file.exists() else {}
+
+    path = str(data_path.resolve())
+    stat = data_path.stat()
+    entry = index.get(path)
+    if entry and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+        return entry["hash"]
+
+    # the file is new or was modified, so its contents are hashed
+    index[path] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": hash_file(data_path),
+    }
+    config.DATA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=config.DATA_CACHE_DIR, suffix=".tmp", delete=False
+    ) as file:
+        json.dump(index, file, indent=2)
+    Path(file.name).replace(index_file)
+    return index[path]["hash"]
+
+
+def get_cache_file(data_path: Path) -> Path:
+    """Get the path of the columnar cache for a CSV file"""
+    # the dtypes are part of the key, so that the cache is rebuilt when they change
+    schema = [config.DATETIME_COLS, config.CATEGORICAL_COLS, config.NUMERIC_COLS]
+    content_hash = get_content_hash(data_path)
+    key = hashlib.sha256(f"{content_hash}{schema}".encode()).hexdigest()
+    return config.DATA_CACHE_DIR / f"{data_path.stem}-{key}.feather"
+
+
+@profiling.profile
+def load_data(data_path) -> pd.DataFrame:
+    """Load a CSV file through a columnar cache keyed on the file's contents"""
+    data_path = Path(data_path)
+    cache_file = get_cache_file(data_path)
+
+    # repeat loads are memory-mapped from the cache
+    if cache_file.exists():
+        logger.info(f"Loading {data_path.name!r} from cache {cache_file.name!r}")
+        table = feather.read_table(cache_file, memory_map=True)
+
+        # converting the string index with the table's pandas metadata has a peak
+        # of several times its size, so it's converted on its own
+        columns = [col for col in table.column_names if col != config.INDEX_COL]
+        df = table.select(columns).to_pandas(split_blocks=True)
+        if config.INDEX_COL in table.column_names:
+            index = table.column(config.INDEX_COL).to_numpy(zero_copy_only=False)
+            df.index = pd.Index(index, name=config.INDEX_COL)
+        return df
+
+    # parse the CSV file and cache it uncompressed so that it can be memory-mapped
+    df = read_csv(data_path)
+    if not config.DATA_CACHE_DIR.exists():
+        config.DATA_CACHE_DIR.mkdir(parents=True)
+
+    tmp_file = cache_file.with_suffix(".tmp")
+    feather.write_feather(df, tmp_file, compression="uncompressed")
+    tmp_file.replace(cache_file)
+    logger.info(f"Cached {data_path.name!r} as {cache_file.name!r}")
+
+    # remove caches of previous versions of the file
+    pattern = f"{data_path.stem}-{'?' * 64}.feather"
+    for stale_file in config.DATA_CACHE_DIR.glob(pattern):
+        if stale_file != cache_file:
+            stale_file.unlink()
+    return df
+
+
+def from_records(records: list) -> pd.DataFrame:
+    """Create a dataframe with typed columns from a list of records"""
+    df = pd.DataFrame.from_records(records)
+    if config.INDEX_COL in df.columns:
+        df = df.set_index(config.INDEX_COL)
+
+    for col in config.DATETIME_COLS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+
+    for col in config.CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return downcast(df)
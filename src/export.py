@@ -0,0 +1,302 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from . import boosting, config, data, predict, profiling, tracking, utils
+
+# logger
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = config.OUTPUT_DIR / "exports"
+
+
+def get_booster(estimator):
+    """Get the native booster of a LightGBM or XGBoost classifier, if any"""
+    if isinstance(estimator, boosting.BoosterClassifier):
+        return estimator.booster
+    if hasattr(estimator, "booster_"):
+        return estimator.booster_
+    if hasattr(estimator, "get_booster"):
+        return estimator.get_booster()
+    return None
+
+
+def to_proba(predictions: np.ndarray) -> np.ndarray:
+    """Convert the positive class probabilities of binary boosters to two columns"""
+    if predictions.ndim == 1:
+        return np.column_stack([1 - predictions, predictions])
+    return predictions
+
+
+def to_array(X) -> np.ndarray:
+    """Convert transformed features to the dense float32 array of compiled models"""
+    if isinstance(X, pd.DataFrame):
+        raise ValueError(
+            "Compiled models require numeric features, use the native backend "
+            "for preprocessors passing categoricals to the model"
+        )
+    if sparse.issparse(X):
+        X = X.toarray()
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+class NativePredictor:
+    """Predict with a booster directly, skipping its scikit-learn wrapper"""
+
+    def __init__(self, booster):
+        self.booster = booster
+
+    def predict_proba(self, X) -> np.ndarray:
+        if hasattr(self.booster, "inplace_predict"):
+            return to_proba(self.booster.inplace_predict(X))
+        return to_proba(self.booster.predict(X))
+
+
+class TreelitePredictor:
+    """Predict with a model compiled to a shared library by treelite"""
+
+    def __init__(self, libpath: Path):
+        self.libpath = libpath
+        self._predictor = None
+
+    def __getstate__(self):
+        # the loaded library is reloaded from its path after unpickling
+        return {"libpath": self.libpath, "_predictor": None}
+
+    def predict_proba(self, X) -> np.ndarray:
+        import treelite_runtime
+
+        if self._predictor is None:
+            self._predictor = treelite_runtime.Predictor(str(self.libpath))
+        dmat = treelite_runtime.DMatrix(to_array(X), dtype="float32")
+        return to_proba(self._predictor.predict(dmat))
+
+
+class OnnxPredictor:
+    """Predict with a model converted to ONNX and run by ONNX Runtime"""
+
+    def __init__(self, model_bytes: bytes):
+        self.model_bytes = model_bytes
+        self._session = None
+
+    def __getstate__(self):
+        return {"model_bytes": self.model_bytes, "_session": None}
+
+    def predict_proba(self, X) -> np.ndarray:
+        import onnxruntime
+
+        if self._session is None:
+            self._session = onnxruntime.InferenceSession(
+                self.model_bytes, providers=["CPUExecutionProvider"]
+            )
+        input_name = self._session.get_inputs()[0].name
+        # the outputs are the labels and the probabilities
+        return self._session.run(None, {input_name: to_array(X)})[1]
+
+
+def compile_native(estimator, X, path: Path):
+    """Use the booster of a model, or the model itself if it has no booster"""
+    booster = get_booster(estimator)
+    return estimator if booster is None else NativePredictor(booster)
+
+
+def compile_treelite(estimator, X, path: Path):
+    """Compile a tree ensemble to a shared library with treelite"""
+    import treelite
+    import treelite.sklearn
+
+    booster = get_booster(estimator)
+    if booster is None:
+        model = treelite.sklearn.import_model(estimator)
+    elif hasattr(booster, "inplace_predict"):
+        model = treelite.Model.from_xgboost(booster)
+    else:
+        model = treelite.Model.from_lightgbm(booster)
+
+    libpath = path.with_suffix(".so")
+    params = {"parallel_comp": os.cpu_count()}
+    model.export_lib(toolchain="gcc", libpath=str(libpath), params=params)
+    return TreelitePredictor(libpath)
+
+
+def compile_onnx(estimator, X, path: Path):
+    """Convert a model to ONNX"""
+    import onnxmltools
+    import skl2onnx
+    from skl2onnx.common.data_types import FloatTensorType
+
+    initial_types = [("input", FloatTensorType([None, X.shape[1]]))]
+    booster = get_booster(estimator)
+    if isinstance(estimator, boosting.BoosterClassifier):
+        raise ValueError("ONNX conversion requires a scikit-learn booster wrapper")
+    if booster is None:
+        options = {id(estimator): {"zipmap": False}}
+        onnx_model = skl2onnx.convert_sklearn(
+            estimator, initial_types=initial_types, options=options
+        )
+    elif hasattr(booster, "inplace_predict"):
+        onnx_model = onnxmltools.convert_xgboost(estimator, initial_types=initial_types)
+    else:
+        onnx_model = onnxmltools.convert_lightgbm(
+            estimator, initial_types=initial_types, zipmap=False
+        )
+    return OnnxPredictor(onnx_model.SerializeToString())
+
+
+# compilers of the fold models to fast inference formats
+backends = {
+    "native": compile_native,
+    "treelite": compile_treelite,
+    "onnx": compile_onnx,
+}
+
+
+class CompiledEnsemble:
+    """Fold ensemble of a run with its models compiled for fast inference.
+
+    Only the models are compiled, the fitted preprocessing pipelines are kept as they
+    are. Fold pipelines with identical preprocessing share a single transform, like
+    in `predict.predict_proba`.
+    """
+
+    def __init__(self, groups: list, classes: np.ndarray):
+        self.groups = groups
+        self.classes_ = classes
+
+    def predict_proba(self, df: pd.DataFrame) -> np.ndarray:
+        predictions = np.zeros((len(df), len(self.classes_)))
+        n_models = 0
+        for preprocessing, models in self.groups:
+            X = preprocessing.transform(df)
+            for model in models:
+                np.add(predictions, model.predict_proba(X), out=predictions)
+                n_models += 1
+        predictions /= n_models
+        return predictions
+
+
+@profiling.profile
+def compile_ensemble(groups: list, df: pd.DataFrame, backend: str, export_dir: Path):
+    """Compile the fold models of each preprocessing group"""
+    compiler = backends[backend]
+    classes = groups[0][1][0].classes_
+    compiled_groups = []
+    for i, (preprocessing, models) in enumerate(groups):
+        X = preprocessing.transform(df.head(1))
+        compiled_models = [
+            compiler(model, X, export_dir / f"group_{i}_model_{j}")
+            for j, model in enumerate(models)
+        ]
+        compiled_groups.append((preprocessing, compiled_models))
+    return CompiledEnsemble(compiled_groups, classes)
+
+
+def time_predictions(func, df: pd.DataFrame, n_repeats: int) -> float:
+    """Get the best wall time of a prediction function over a number of repeats"""
+    times = []
+    for _ in range(n_repeats):
+        start_time = time.perf_counter()
+        func(df)
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+@profiling.profile
+def export(
+    run_id: str, backend="native", data_path="", n_repeats=3, tolerance=1e-5
+) -> Path:
+    """Compile the fold ensemble of a run and check it against `predict.predict`.
+
+    The models are compiled in a temporary directory, which replaces the export
+    directory only once the compiled predictions are within the tolerance. The
+    compiled ensemble is saved to a single file, which is logged to a child run of
+    the run with the maximum difference from the original probabilities and the
+    speedup.
+    """
+    data_path = Path(data_path) if data_path else config.TEST_DATA
+    df = data.load_data(data_path)
+
+    estimators = utils.load_models(run_id)
+    groups = predict.group_estimators(estimators)
+
+    export_dir = EXPORT_DIR / f"{run_id}-{backend}"
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    temp_dir = Path(tempfile.mkdtemp(prefix=f".{export_dir.name}-", dir=EXPORT_DIR))
+    try:
+        ensemble = compile_ensemble(groups, df, backend, temp_dir)
+
+        # numerical parity with the original pipelines
+        with profiling.span("verify"):
+            expected, _ = predict.predict_proba(groups, df)
+            max_abs_diff = float(np.abs(ensemble.predict_proba(df) - expected).max())
+        if max_abs_diff > tolerance:
+            raise ValueError(
+                f"Compiled predictions differ from the original ones by "
+                f"{max_abs_diff:g}"
+            )
+
+        # latency and throughput on the verification data
+        with profiling.span("benchmark"):
+            original_time = time_predictions(
+                lambda df: predict.predict_proba(groups, df), df, n_repeats
+            )
+            compiled_time = time_predictions(ensemble.predict_proba, df, n_repeats)
+
+        # the compiled libraries are loaded from the export directory
+        for _, models in ensemble.groups:
+            for model in models:
+                if isinstance(model, TreelitePredictor):
+                    model.libpath = export_dir / model.libpath.name
+        joblib.dump(ensemble, temp_dir / "ensemble.joblib")
+        temp_dir.chmod(0o755)
+        if export_dir.exists():
+            shutil.rmtree(export_dir)
+        os.replace(temp_dir, export_dir)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    metrics = {
+        "export/max_abs_diff": max_abs_diff,
+        "export/original_rows_per_sec": len(df) / original_time,
+        "export/compiled_rows_per_sec": len(df) / compiled_time,
+        "export/speedup": original_time / compiled_time,
+    }
+    logger.info(
+        f"Compiled ensemble predicts {len(df)} rows in {compiled_time:.4f} seconds "
+        f"vs {original_time:.4f} seconds ({metrics['export/speedup']:.2f}x), "
+        f"max difference {max_abs_diff:g}"
+    )
+    file = export_dir / "ensemble.joblib"
+    logger.info(f"Compiled ensemble saved to {str(file)!r}")
+
+    tags = {
+        "backend": backend,
+        "mlflow.parentRunId": run_id,
+        "parent_run_id": run_id,
+    }
+    with tracking.start_run(run_name=f"export+{backend}", tags=tags) as run_logger:
+        run_logger.log_params(
+            {
+                "data_path": str(data_path),
+                "n_repeats": n_repeats,
+                "tolerance": tolerance,
+            }
+        )
+        run_logger.log_metrics(metrics)
+        run_logger.client.log_artifacts(
+            run_logger.run_id, str(export_dir), f"export/{backend}"
+        )
+    return file
+
+
+def load_ensemble(file) -> CompiledEnsemble:
+    """Load a compiled ensemble saved by `export`"""
+    return joblib.load(file)
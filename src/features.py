@@ -0,0 +1,167 @@
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from joblib.disk import memstr_to_bytes
+from pyarrow import feather
+from scipy import sparse
+
+from . import config, data, profiling, utils
+
+# logger
+logger = logging.getLogger(__name__)
+
+# arrays of a CSR matrix, which are saved to separate files to be memory-mapped
+CSR_ARRAYS = ("data", "indices", "indptr")
+
+
+def get_path(run_id: str, data_hash: str, preprocessing) -> Path:
+    """Get the directory of a dataset transformed by the preprocessing of a run.
+
+    Folds whose preprocessing steps are identical, e.g. stateless transformers,
+    share the same directory.
+    """
+    return config.FEATURE_STORE_DIR / run_id / data_hash / joblib.hash(preprocessing)
+
+
+def save_matrix(path: Path, X) -> None:
+    """Save a feature matrix to a directory in a memory-mappable format.
+
+    Dense arrays are saved to `X.npy`, sparse matrices to the `.npy` files of their
+    CSR arrays and dataframes, e.g. with categoricals for the model, to `X.feather`.
+    Arrays of Python objects, e.g. mixed categoricals, are saved to
+    `X_object.feather` as typed columns instead of being pickled.
+    """
+    # the matrix is written to a temporary directory that is renamed when complete,
+    # so that readers never see a partial matrix
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_dir = Path(tempfile.mkdtemp(prefix=".", dir=path.parent))
+    try:
+        if isinstance(X, pd.DataFrame):
+            feather.write_feather(X.reset_index(drop=True), temp_dir / "X.feather")
+        elif sparse.issparse(X):
+            X = X.tocsr()
+            for name in CSR_ARRAYS:
+                np.save(temp_dir / f"{name}.npy", getattr(X, name))
+            np.save(temp_dir / "shape.npy", np.array(X.shape))
+        elif np.asarray(X).dtype.hasobject:
+            columns = pd.DataFrame(np.asarray(X)).infer_objects()
+            columns.columns = columns.columns.astype(str)
+            feather.write_feather(columns, temp_dir / "X_object.feather")
+        else:
+            np.save(temp_dir / "X.npy", np.asarray(X), allow_pickle=False)
+    except Exception:
+        shutil.rmtree(temp_dir)
+        raise
+
+    try:
+        temp_dir.rename(path)
+    except OSError:
+        # another process saved the same matrix first
+        shutil.rmtree(temp_dir)
+
+
+def load_matrix(path: Path, index=None):
+    """Load a feature matrix saved by `save_matrix`, memory-mapping its arrays"""
+    # the modification time of the directory orders the matrices for eviction
+    os.utime(path)
+    if (path / "X.feather").exists():
+        X = feather.read_feather(path / "X.feather", memory_map=True)
+        if index is not None:
+            X.index = index
+        return X
+    if (path / "X_object.feather").exists():
+        X = feather.read_feather(path / "X_object.feather", memory_map=True)
+        return X.to_numpy(dtype=object)
+    if (path / "shape.npy").exists():
+        arrays = [np.load(path / f"{name}.npy", mmap_mode="r") for name in CSR_ARRAYS]
+        return sparse.csr_matrix(
+            tuple(arrays), shape=tuple(np.load(path / "shape.npy"))
+        )
+    return np.load(path / "X.npy", mmap_mode="r")
+
+
+def evict(bytes_limit=None) -> None:
+    """Delete the least recently used matrices beyond the size of the feature store"""
+    if bytes_limit is None:
+        bytes_limit = config.FEATURE_STORE_SIZE
+    if isinstance(bytes_limit, str):
+        bytes_limit = memstr_to_bytes(bytes_limit)
+
+    # the matrices are the directories of run / data hash / preprocessing hash,
+    # without the temporary directories of the matrices being saved
+    entries = []
+    for path in config.FEATURE_STORE_DIR.glob("*/*/*"):
+        try:
+            size = sum(file.stat().st_size for file in path.iterdir())
+            entries.append((path.stat().st_mtime, size, path))
+        except FileNotFoundError:
+            # deleted by another process
+            continue
+    entries = [entry for entry in entries if not entry[2].name.startswith(".")]
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= bytes_limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+        logger.debug(f"Evicted features from {str(path)!r}")
+
+
+@profiling.profile
+def transform(run_id: str, preprocessing, df: pd.DataFrame, data_hash=None):
+    """Transform a dataframe with the preprocessing of a run, once per dataset.
+
+    The transformed matrix is saved to the feature store on the first call and
+    loaded from it on the next ones, e.g. by predictions and notebooks. The least
+    recently used matrices are evicted beyond `FEATURE_STORE_SIZE`.
+    """
+    if data_hash is None:
+        data_hash = data.hash_frame(df)
+    path = get_path(run_id, data_hash, preprocessing)
+    if path.exists():
+        logger.debug(f"Loading features from {str(path)!r}")
+        return load_matrix(path, df.index)
+
+    X = preprocessing.transform(df)
+    try:
+        save_matrix(path, X)
+    except pa.ArrowException as error:
+        # e.g. columns of values with different types
+        logger.warning(f"Features of {len(df)} rows can't be saved: {error}")
+        return X
+    logger.info(f"Saved features of {len(df)} rows to {str(path)!r}")
+    evict()
+    return X
+
+
+def transform_groups(run_id: str, groups: list, df: pd.DataFrame, n_jobs=1) -> list:
+    """Transform a dataframe with each preprocessing group of a run"""
+    data_hash = data.hash_frame(df)
+    return joblib.Parallel(n_jobs=n_jobs, prefer="threads")(
+        joblib.delayed(transform)(run_id, preprocessing, df, data_hash)
+        for preprocessing, _ in groups
+    )
+
+
+def get_features(run_id: str, df: pd.DataFrame, fold=0):
+    """Get the features of a dataframe transformed by a fold pipeline of a run.
+
+    This is meant for analysis, e.g. of the models' errors or feature importances,
+    without recomputing the preprocessing.
+    """
+    estimator = utils.load_models(run_id)[fold]
+    return transform(run_id, estimator[:-1], df)
+
+
+def clear(run_id=None) -> None:
+    """Delete the saved features of a run, or of all runs"""
+    path = config.FEATURE_STORE_DIR / run_id if run_id else config.FEATURE_STORE_DIR
+    shutil.rmtree(path, ignore_errors=True)
@@ -1,24 +1,92 @@
-import catboost
-import lightgbm
-import xgboost
-from sklearn import dummy, ensemble, tree
-
 from .config import N_JOBS, RANDOM_SEED, VERBOSITY
+from .registry import LazyRegistry, lazy
+
+# models are created, and their backends imported, when they are first used
+models = LazyRegistry(
+    {
+        "dc": lazy("sklearn.dummy", "DummyClassifier"),
+        "dt": lazy("sklearn.tree", "DecisionTreeClassifier", random_state=RANDOM_SEED),
+        "rf": lazy(
+            "sklearn.ensemble",
+            "RandomForestClassifier",
+            n_jobs=N_JOBS,
+            random_state=RANDOM_SEED,
+            verbose=VERBOSITY,
+        ),
+        "xgb": lazy(
+            "xgboost",
+            "XGBClassifier",
+            n_jobs=N_JOBS,
+            random_state=RANDOM_SEED,
+            verbosity=VERBOSITY,
+        ),
+        "cb": lazy(
+            "catboost",
+            "CatBoostClassifier",
+            random_state=RANDOM_SEED,
+            verbose=VERBOSITY,
+        ),
+        "lgb": lazy(
+            "lightgbm",
+            "LGBMClassifier",
+            n_jobs=N_JOBS,
+            random_state=RANDOM_SEED,
+            verbose=VERBOSITY,
+        ),
+        "hgb": lazy(
+            "sklearn.ensemble",
+            "HistGradientBoostingClassifier",
+            random_state=RANDOM_SEED,
+            verbose=VERBOSITY,
+        ),
+    }
+)
+
+# models that don't support sparse features
+dense_models = ["hgb"]
+
+# models without a threads parameter whose fits use OpenMP threads
+openmp_models = ["hgb"]
+
+
+def get_thread_params(model, n_threads: int) -> dict:
+    """Get the parameters that limit the number of threads used by a model."""
+    model_params = model.get_params()
+    if "n_jobs" in model_params:
+        return {"n_jobs": n_threads}
+    if "thread_count" in model_params:
+        return {"thread_count": n_threads}
+    return {}
+
+
+def is_multithreaded(name: str) -> bool:
+    """Check whether the fits of a model use more than one thread."""
+    return name in openmp_models or bool(get_thread_params(models[name], 1))
+
+
+def get_categorical_params(model: str, estimator, X) -> dict:
+    """Get the parameters that enable a model's native categorical support.
+
+    Categorical columns are those with a category dtype, e.g. from the `nc*`
+    preprocessors. LightGBM detects them by itself.
+    """
+    if not hasattr(X, "dtypes"):
+        return {}
+    categorical = (X.dtypes == "category").to_numpy()
+    if not categorical.any():
+        return {}
 
-models = {
-    "dc": dummy.DummyClassifier(),
-    "dt": tree.DecisionTreeClassifier(random_state=RANDOM_SEED),
-    "rf": ensemble.RandomForestClassifier(
-        n_jobs=N_JOBS, random_state=RANDOM_SEED, verbose=VERBOSITY
-    ),
-    "xgb": xgboost.XGBClassifier(
-        n_jobs=N_JOBS, random_state=RANDOM_SEED, verbosity=VERBOSITY
-    ),
-    "cb": catboost.CatBoostClassifier(random_state=RANDOM_SEED, verbose=VERBOSITY),
-    "lgb": lightgbm.LGBMClassifier(
-        n_jobs=N_JOBS, random_state=RANDOM_SEED, verbose=VERBOSITY
-    ),
-    "hgb": ensemble.HistGradientBoostingClassifier(
-        random_state=RANDOM_SEED, verbose=VERBOSITY
-    ),
-}
+    if model == "xgb":
+        return {"enable_categorical": True, "tree_method": "hist"}
+    if model == "cb":
+        return {"cat_features": list(X.columns[categorical])}
+    if model == "hgb":
+        # scikit-learn limits the number of categories to the number of bins, so
+        # columns with more categories are split on as numeric codes
+        max_bins = estimator.get_params()["max_bins"]
+        mask = [
+            is_categorical and len(X[col].cat.categories) <= max_bins
+            for col, is_categorical in zip(X.columns, categorical)
+        ]
+        return {"categorical_features": mask} if any(mask) else {}
+    return {}
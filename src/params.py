@@ -1,7 +1,10 @@
-import optuna.distributions as dist
+from .registry import LazyRegistry, lazy
 
-param_distributions = {
-    "xgb": {
+
+def xgb_params() -> dict:
+    import optuna.distributions as dist
+
+    return {
         "n_estimators": dist.IntUniformDistribution(10, 5000),
         "learning_rate": dist.LogUniformDistribution(0.01, 0.1),
         "colsample_bytree": dist.UniformDistribution(0.1, 1.0),
@@ -9,8 +12,13 @@ param_distributions = {
         "subsample": dist.UniformDistribution(0.1, 1.0),
         "reg_alpha": dist.LogUniformDistribution(1e-9, 100.0),
         "reg_lambda": dist.LogUniformDistribution(1e-9, 100.0),
-    },
-    "cb": {
+    }
+
+
+def cb_params() -> dict:
+    import optuna.distributions as dist
+
+    return {
         "iterations": dist.IntUniformDistribution(10, 5000),
         "learning_rate": dist.LogUniformDistribution(0.01, 0.1),
         "depth": dist.IntUniformDistribution(1, 8),
@@ -18,8 +26,13 @@ param_distributions = {
         "bagging_temperature": dist.LogUniformDistribution(1e-9, 1.0),
         "border_count": dist.IntUniformDistribution(1, 255),
         "l2_leaf_reg": dist.IntUniformDistribution(2, 30),
-    },
-    "lgb": {
+    }
+
+
+def lgb_params() -> dict:
+    import optuna.distributions as dist
+
+    return {
         "n_estimators": dist.IntUniformDistribution(10, 1000),
         "learning_rate": dist.LogUniformDistribution(0.01, 0.1),
         "feature_fraction": dist.UniformDistribution(0.1, 1.0),
@@ -27,15 +40,38 @@ param_distributions = {
         "subsample": dist.UniformDistribution(0.01, 1.0),
         "reg_alpha": dist.LogUniformDistribution(1e-8, 10.0),
         "reg_lambda": dist.LogUniformDistribution(1e-8, 10.0),
-    },
-    "hgb": {
+    }
+
+
+def hgb_params() -> dict:
+    import optuna.distributions as dist
+
+    return {
         "learning_rate": dist.LogUniformDistribution(0.01, 1.0),
         "max_iter": dist.IntUniformDistribution(10, 10000),
         "max_depth": dist.IntUniformDistribution(2, 12),
         "min_samples_leaf": dist.IntUniformDistribution(2, 300),
         "l2_regularization": dist.LogUniformDistribution(0.01, 100.0),
         "max_bins": dist.IntUniformDistribution(32, 255),
-    },
+    }
+
+
+# parameter spaces are created, and optuna imported, on first use
+param_distributions = LazyRegistry(
+    {"xgb": xgb_params, "cb": cb_params, "lgb": lgb_params, "hgb": hgb_params}
+)
+
+# samplers and pruners are created in each tuning worker so that they don't share
+# random states
+samplers = {
+    "tpe": lazy("optuna.samplers", "TPESampler"),
+    "random": lazy("optuna.samplers", "RandomSampler"),
+}
+
+pruners = {
+    "hyperband": lazy("optuna.pruners", "HyperbandPruner", min_resource=1),
+    "median": lazy("optuna.pruners", "MedianPruner", n_warmup_steps=0),
+    "none": lazy("optuna.pruners", "NopPruner"),
 }
 
 
@@ -49,3 +85,32 @@ def get_params(model_name: str) -> dict:
     # append the model name to the parameter space keys
     param_dist = {f"{model_name}__{key}": val for key, val in param_dist.items()}
     return param_dist
+
+
+def suggest_params(trial, model_name: str) -> dict:
+    """Sample hyperparameters for the given model from an Optuna trial."""
+    import optuna.distributions as dist
+
+    params = {}
+    for name, distribution in get_params(model_name).items():
+        if isinstance(distribution, dist.IntUniformDistribution):
+            value = trial.suggest_int(
+                name, distribution.low, distribution.high, step=distribution.step
+            )
+        elif isinstance(distribution, dist.LogUniformDistribution):
+            value = trial.suggest_float(
+                name, distribution.low, distribution.high, log=True
+            )
+        elif isinstance(distribution, dist.UniformDistribution):
+            value = trial.suggest_float(name, distribution.low, distribution.high)
+        elif isinstance(distribution, dist.CategoricalDistribution):
+            value = trial.suggest_categorical(name, distribution.choices)
+        else:
+            raise ValueError(f"Unsupported distribution {distribution!r} for {name!r}")
+        params[name] = value
+    return params
+
+
+def strip_prefix(params: dict) -> dict:
+    """Remove the model name prefix from pipeline parameter names."""
+    return {key.split("__", 1)[1]: val for key, val in params.items()}
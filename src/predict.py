@@ -1,68 +1,281 @@
+import logging
+import threading
+import time
 from pathlib import Path
 
+import joblib
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import parquet
+from sklearn.metrics import log_loss
 
-from . import config, utils
+from . import config, data, features, profiling, utils
 
+# logger
+logger = logging.getLogger(__name__)
 
-@utils.timer
-def save_predictions(predictions: pd.DataFrame, file_name: str) -> None:
-    """Save predictions"""
+# the fold models of a run, or the single model saved alongside them
+modes = ("ensemble", "single")
+
+
+def get_predictions_file(file_name: str) -> Path:
+    """Get the path of a file in the predictions folder"""
     # create folder for saving predictions
     predictions_path = config.OUTPUT_DIR / "predictions"
     if not predictions_path.exists():
         predictions_path.mkdir()
+    return predictions_path / file_name
 
-    # save predictions
-    file = predictions_path / file_name
-    predictions.to_csv(file, index=False)
 
+@profiling.profile
+def save_predictions(predictions: pd.DataFrame, file_name: str) -> None:
+    """Save predictions"""
+    file = get_predictions_file(file_name)
+    if file.suffix == ".parquet":
+        predictions.to_parquet(file, index=False)
+    else:
+        predictions.to_csv(file, index=False)
 
-@utils.timer
-def predict(run_id: str, data_path="", proba=False, save_preds=True) -> None:
-    # load data
-    if not data_path:
-        data_path = config.TEST_DATA
+
+def format_predictions(
+    predictions: np.ndarray, classes: np.ndarray, index: pd.Index, proba=False
+) -> pd.DataFrame:
+    """Format averaged probabilities as probabilities or class labels"""
+    predictions_df = pd.DataFrame(predictions, columns=classes, index=index)
+
+    # format predictions depending on whether we want probabilities or classes
+    if proba:
+        # get the probability of the positive class for binary classification
+        if predictions_df.shape[1] == 2:
+            predictions_df = predictions_df.iloc[:, 1].rename(config.TARGET_COL)
     else:
-        data_path = Path(data_path)
+        # the label of the most probable class, which also works without rows
+        labels = np.asarray(classes)[predictions.argmax(axis=1)]
+        predictions_df = pd.Series(labels, index=index, name=config.TARGET_COL)
 
-    test_df = pd.read_csv(
-        data_path, index_col=config.INDEX_COL, parse_dates=config.DATETIME_COLS
-    )
+    # reset the index
+    return predictions_df.reset_index()
 
-    # load models
-    estimators = utils.load_models(run_id)
 
-    # obtain predictions
-    predictions = None
+def group_estimators(estimators: list) -> list:
+    """Group fold pipelines by their fitted preprocessing steps.
+
+    Pipelines whose preprocessing steps are identical, e.g. stateless transformers,
+    share a single transform of the input data.
+    """
+    groups = {}
     for estimator in estimators:
-        test_preds = estimator.predict_proba(test_df)
+        preprocessing = estimator[:-1]
+        key = joblib.hash(preprocessing)
+        groups.setdefault(key, (preprocessing, []))[1].append(estimator[-1])
+    return list(groups.values())
+
+
+def predict_proba(groups: list, df: pd.DataFrame, n_jobs=1, run_id=None) -> tuple:
+    """Average the probabilities of the fold models on a dataframe.
+
+    If the ID of the run of the models is given, the transformed data is loaded
+    from the feature store, or saved to it the first time.
+    """
+    classes = groups[0][1][0].classes_
+    if not len(df):
+        return np.zeros((0, len(classes))), classes
+    parallel = joblib.Parallel(n_jobs=n_jobs, prefer="threads")
 
-        if predictions is None:
-            predictions = test_preds
+    # transform the data once per distinct preprocessor
+    with profiling.span("transform"):
+        if run_id is None:
+            transformed = parallel(
+                joblib.delayed(preprocessing.transform)(df)
+                for preprocessing, _ in groups
+            )
         else:
-            predictions += test_preds
+            transformed = features.transform_groups(run_id, groups, df, n_jobs)
+
+    # sum the probabilities of the fold models in a preallocated array
+    predictions = np.zeros((len(df), len(classes)))
+    lock = threading.Lock()
+
+    def add_predictions(model, X):
+        test_preds = model.predict_proba(X)
+        with lock:
+            np.add(predictions, test_preds, out=predictions)
+
+    with profiling.span("predict_proba"):
+        parallel(
+            joblib.delayed(add_predictions)(model, X)
+            for (_, models), X in zip(groups, transformed)
+            for model in models
+        )
+
+    # average predictions
+    n_models = sum(len(models) for _, models in groups)
+    predictions /= n_models
+    return predictions, classes
+
+
+def load_groups(run_id: str, mode="ensemble") -> list:
+    """Load the models of a run for a prediction mode, grouped by preprocessing"""
+    if mode == "single":
+        return group_estimators([utils.load_model(run_id, "model_single")])
+    return group_estimators(utils.load_models(run_id))
+
+
+@profiling.profile
+def compare_modes(run_id: str, df: pd.DataFrame, n_jobs=1) -> pd.DataFrame:
+    """Compare the log loss and prediction time of the ensemble and single modes.
 
-    # average predictions and create a dataframe
-    predictions /= len(estimators)
-    predictions_df = pd.DataFrame(
-        predictions, columns=estimator.classes_, index=test_df.index
+    The comparison is logged to a child run of the run, so that a cheaper mode can
+    be picked when latency matters.
+    """
+    if config.TARGET_COL not in df.columns:
+        raise ValueError(f"Comparing modes requires the {config.TARGET_COL!r} column")
+    X = df.drop(config.TARGET_COL, axis=1)
+    y = df[config.TARGET_COL]
+
+    report = {}
+    for mode in modes:
+        groups = load_groups(run_id, mode)
+        start_time = time.perf_counter()
+        predictions, classes = predict_proba(groups, X, n_jobs)
+        run_time = time.perf_counter() - start_time
+        report[mode] = {
+            "log_loss": log_loss(y, predictions, labels=classes),
+            "seconds": run_time,
+            "rows_per_sec": len(X) / run_time,
+        }
+    report = pd.DataFrame(report).T
+
+    log_loss_delta = (
+        report.loc["single", "log_loss"] - report.loc["ensemble", "log_loss"]
+    )
+    speedup = report.loc["ensemble", "seconds"] / report.loc["single", "seconds"]
+    logger.info(
+        f"Prediction modes of run {run_id!r}:\n{report.round(5)}\n"
+        f"Single model: {log_loss_delta:+.5f} log loss, {speedup:.2f}x faster"
     )
 
-    # format predictions depending on whether we want probabilities or classes
-    if proba:
-        # get the probability of the positive class for binary classification
-        if predictions_df.shape[1] == 2:
-            predictions_df = predictions_df.iloc[:, 1].rename(config.TARGET_COL)
+    metrics = {"mode/log_loss_delta": log_loss_delta, "mode/speedup": speedup}
+    for mode, row in report.iterrows():
+        metrics[f"mode/{mode}_log_loss"] = row["log_loss"]
+        metrics[f"mode/{mode}_rows_per_sec"] = row["rows_per_sec"]
+
+    from . import tracking
+
+    tags = {"mlflow.parentRunId": run_id, "parent_run_id": run_id}
+    with tracking.start_run(run_name="compare-modes", tags=tags) as run_logger:
+        run_logger.log_metrics(metrics)
+    return report
+
+
+def predict_frame(groups: list, df: pd.DataFrame, proba=False, n_jobs=1, run_id=None):
+    """Average the predictions of the fold models on a dataframe"""
+    predictions, classes = predict_proba(groups, df, n_jobs, run_id)
+    return format_predictions(predictions, classes, df.index, proba)
+
+
+@profiling.profile
+def predict_chunks(
+    groups: list,
+    data_path: Path,
+    chunksize: int,
+    proba=False,
+    n_jobs=1,
+    file_name=None,
+):
+    """Predict on chunks of a file, streaming the predictions to an output file.
+
+    Only the predictions of the current chunk are kept in memory, and the path of
+    the output file is returned. If no file name is given, the predictions aren't
+    saved and nothing is returned.
+    """
+    file = get_predictions_file(file_name) if file_name else None
+    writer = None
+    n_rows = 0
+    start_time = time.perf_counter()
+    for chunk in data.read_csv(data_path, chunksize=chunksize):
+        chunk_preds = predict_frame(groups, chunk, proba, n_jobs)
+
+        # append the predictions to the output file, which has a header even if
+        # there are no rows
+        if file is not None and file.suffix == ".parquet":
+            table = pa.Table.from_pandas(chunk_preds, preserve_index=False)
+            if writer is None:
+                writer = parquet.ParquetWriter(file, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        elif file is not None:
+            first_chunk = n_rows == 0
+            chunk_preds.to_csv(
+                file, mode="w" if first_chunk else "a", header=first_chunk, index=False
+            )
+
+        n_rows += len(chunk)
+        logger.debug(f"Predicted {n_rows} rows")
+
+    if writer is not None:
+        writer.close()
+
+    run_time = time.perf_counter() - start_time
+    logger.info(
+        f"Predicted {n_rows} rows in {run_time:.4f} seconds "
+        f"({n_rows / run_time:.1f} rows/sec)"
+    )
+    return file
+
+
+@profiling.profile
+def predict(
+    run_id: str,
+    data_path="",
+    proba=False,
+    save_preds=True,
+    chunksize=None,
+    output_format="csv",
+    n_jobs=1,
+    mode="ensemble",
+    compare=False,
+):
+    """Predict on a dataset with the models of a run.
+
+    The predictions are returned as a dataframe. If `chunksize` is given, the data
+    is read and predicted on in chunks of that many rows, and the predictions are
+    streamed to their file, whose path is returned instead.
+    """
+    # load data
+    if not data_path:
+        data_path = config.TEST_DATA
     else:
-        predictions_df = predictions_df.idxmax(axis=1).rename(config.TARGET_COL)
+        data_path = Path(data_path)
 
-    # reset the index
-    predictions_df = predictions_df.reset_index()
+    # compare the prediction modes on labelled data
+    if compare:
+        compare_modes(run_id, data.load_data(data_path), n_jobs)
+
+    # load models
+    groups = load_groups(run_id, mode)
+    suffix = "_single" if mode == "single" else ""
+    file_name = f"{run_id}_{data_path.stem}{suffix}.{output_format}"
+
+    # stream predictions to the output file to bound memory usage
+    if chunksize:
+        return predict_chunks(
+            groups,
+            data_path,
+            chunksize,
+            proba,
+            n_jobs,
+            file_name=file_name if save_preds else None,
+        )
+
+    test_df = data.load_data(data_path)
+
+    # obtain predictions
+    predictions_df = predict_frame(groups, test_df, proba, n_jobs, run_id)
 
     # save predictions
     if save_preds:
-        save_predictions(predictions_df, f"{run_id}_{data_path.stem}.csv")
+        save_predictions(predictions_df, file_name)
 
     # return predictions
     return predictions_df
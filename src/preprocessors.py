@@ -1,131 +1,258 @@
-from feature_engine.datetime import DatetimeFeatures
-from feature_engine.transformation import LogTransformer
-from sklearn import compose, decomposition, impute, pipeline, preprocessing
-from sklearn.feature_extraction import text
-from sklego.preprocessing import IdentityTransformer
-
 from . import config
+from .registry import LazyRegistry, lazy
 
 DATETIME_FEATURES = ["month", "day_of_month", "day_of_week", "hour"]
 
-imputers = {
-    "constant": impute.SimpleImputer(strategy="constant", fill_value="unknown"),
-    "knn": impute.KNNImputer(),
-    "mean": impute.SimpleImputer(),
-    "median": impute.SimpleImputer(strategy="median"),
-    "mode": impute.SimpleImputer(strategy="most_frequent"),
-}
-
-encoders = {
-    "one_hot": preprocessing.OneHotEncoder(
-        handle_unknown="infrequent_if_exist", min_frequency=0.01
-    ),
-    "ordinal": preprocessing.OrdinalEncoder(
-        handle_unknown="use_encoded_value", unknown_value=-999
-    ),
-}
-
-decomposers = {
-    "nmf": decomposition.NMF(),
-    "truncated_svd": decomposition.TruncatedSVD(),
-}
-
-vectorizers = {
-    "count": text.CountVectorizer(stop_words="english"),
-    "tfidf": text.TfidfVectorizer(stop_words="english"),
-}
-
-
-gender_pipe = pipeline.Pipeline(
-    [("encoder", encoders["ordinal"]), ("imputer", imputers["mode"])],
-    verbose=config.VERBOSITY,
+imputers = LazyRegistry(
+    {
+        "constant": lazy(
+            "sklearn.impute", "SimpleImputer", strategy="constant", fill_value="unknown"
+        ),
+        "knn": lazy("sklearn.impute", "KNNImputer"),
+        "mean": lazy("sklearn.impute", "SimpleImputer"),
+        "median": lazy("sklearn.impute", "SimpleImputer", strategy="median"),
+        "mode": lazy("sklearn.impute", "SimpleImputer", strategy="most_frequent"),
+    }
 )
 
-preprocessors = {
-    "c1": compose.make_column_transformer(
-        (DatetimeFeatures(features_to_extract=DATETIME_FEATURES), ["PURCHASED_AT"]),
-        (gender_pipe, ["USER_GENDER"]),
-        (
-            IdentityTransformer(),
-            ["IS_PURCHASE_PAID_VIA_MPESA_SEND_MONEY", "USER_HOUSEHOLD"],
+encoders = LazyRegistry(
+    {
+        "categorical": lazy(f"{__package__}.transformers", "CategoricalEncoder"),
+        "native": lazy(f"{__package__}.transformers", "NativeCategoricalEncoder"),
+        "one_hot": lazy(
+            "sklearn.preprocessing",
+            "OneHotEncoder",
+            handle_unknown="infrequent_if_exist",
+            min_frequency=0.01,
         ),
-        n_jobs=config.N_JOBS,
-        verbose=config.VERBOSE,
-    ),
-    # add discretized income and purchase value to `c1`
-    "c2": compose.make_column_transformer(
-        (DatetimeFeatures(features_to_extract=DATETIME_FEATURES), ["PURCHASED_AT"]),
+        "ordinal": lazy(
+            "sklearn.preprocessing",
+            "OrdinalEncoder",
+            handle_unknown="use_encoded_value",
+            unknown_value=-999,
+        ),
+    }
+)
+
+decomposers = LazyRegistry(
+    {
+        "nmf": lazy("sklearn.decomposition", "NMF"),
+        "truncated_svd": lazy("sklearn.decomposition", "TruncatedSVD"),
+    }
+)
+
+vectorizers = LazyRegistry(
+    {
+        "count": lazy(
+            "sklearn.feature_extraction.text", "CountVectorizer", stop_words="english"
+        ),
+        # character n-grams hashed to a fixed number of features, with no vocabulary
+        "hashing": lazy(
+            "sklearn.feature_extraction.text",
+            "HashingVectorizer",
+            analyzer="char_wb",
+            ngram_range=(2, 4),
+            n_features=2**16,
+            alternate_sign=False,
+        ),
+        "tfidf": lazy(
+            "sklearn.feature_extraction.text", "TfidfVectorizer", stop_words="english"
+        ),
+    }
+)
+
+
+def make_column_transformer(*transformers, **kwargs):
+    """Create a column transformer with the project's verbosity.
+
+    The number of jobs is left to the active joblib backend, which is set by
+    `scheduler.limit_threads`.
+    """
+    from sklearn import compose
+
+    return compose.make_column_transformer(
+        *transformers, verbose=config.VERBOSE, **kwargs
+    )
+
+
+def base_transformers(pandas_output=False) -> list:
+    """Transformers shared by the `c*` and `nc*` preprocessors.
+
+    The numeric columns are converted to float32, since a boolean column next to an
+    integer column makes the column transformer stack its output as an object
+    array. With `pandas_output` they are passed through with their dtypes instead.
+    """
+    from sklearn import pipeline, preprocessing
+
+    from .transformers import CalendarFeatures, to_float32
+
+    gender_pipe = pipeline.Pipeline(
+        [("encoder", encoders["categorical"]), ("imputer", imputers["mode"])],
+        verbose=config.VERBOSITY,
+    )
+    numeric = preprocessing.FunctionTransformer(
+        to_float32, feature_names_out="one-to-one"
+    )
+    return [
+        (CalendarFeatures(features_to_extract=DATETIME_FEATURES), ["PURCHASED_AT"]),
         (gender_pipe, ["USER_GENDER"]),
         (
-            IdentityTransformer(),
+            "passthrough" if pandas_output else numeric,
             ["IS_PURCHASE_PAID_VIA_MPESA_SEND_MONEY", "USER_HOUSEHOLD"],
         ),
+    ]
+
+
+def c1():
+    return make_column_transformer(*base_transformers())
+
+
+def c2():
+    """Add discretized income and purchase value to `c1`"""
+    from sklearn import preprocessing
+
+    return make_column_transformer(
+        *base_transformers(),
         (
             preprocessing.KBinsDiscretizer(encode="ordinal"),
             ["PURCHASE_VALUE", "USER_INCOME"],
         ),
-        n_jobs=config.N_JOBS,
-        verbose=config.VERBOSE,
-    ),
-    # add discretized purchase value and log transformed income to `c1`
-    "c3": compose.make_column_transformer(
-        (DatetimeFeatures(features_to_extract=DATETIME_FEATURES), ["PURCHASED_AT"]),
-        (gender_pipe, ["USER_GENDER"]),
-        (
-            IdentityTransformer(),
-            ["IS_PURCHASE_PAID_VIA_MPESA_SEND_MONEY", "USER_HOUSEHOLD"],
-        ),
+    )
+
+
+def c3():
+    """Add discretized purchase value and log transformed income to `c1`"""
+    from feature_engine.transformation import LogTransformer
+    from sklearn import preprocessing
+
+    return make_column_transformer(
+        *base_transformers(),
         (preprocessing.KBinsDiscretizer(encode="ordinal"), ["PURCHASE_VALUE"]),
         (LogTransformer(), ["USER_INCOME"]),
-        n_jobs=config.N_JOBS,
-        verbose=config.VERBOSE,
-    ),
-    # add ordinal encoded merchant name and user id to `c1`
-    "c4": compose.make_column_transformer(
-        (DatetimeFeatures(features_to_extract=DATETIME_FEATURES), ["PURCHASED_AT"]),
-        (gender_pipe, ["USER_GENDER"]),
-        (
-            IdentityTransformer(),
-            ["IS_PURCHASE_PAID_VIA_MPESA_SEND_MONEY", "USER_HOUSEHOLD"],
-        ),
-        (encoders["ordinal"], ["MERCHANT_NAME", "USER_ID"]),
-        n_jobs=config.N_JOBS,
-        verbose=config.VERBOSE,
-    ),
-    # add ordinal encoded merchant name and user id to `c2`
-    "c5": compose.make_column_transformer(
-        (DatetimeFeatures(features_to_extract=DATETIME_FEATURES), ["PURCHASED_AT"]),
-        (gender_pipe, ["USER_GENDER"]),
-        (
-            IdentityTransformer(),
-            ["IS_PURCHASE_PAID_VIA_MPESA_SEND_MONEY", "USER_HOUSEHOLD"],
-        ),
+    )
+
+
+def c4():
+    """Add the category codes of merchant name and user id to `c1`"""
+    return make_column_transformer(
+        *base_transformers(),
+        (encoders["categorical"], ["MERCHANT_NAME", "USER_ID"]),
+    )
+
+
+def c5():
+    """Add the category codes of merchant name and user id to `c2`"""
+    from sklearn import preprocessing
+
+    return make_column_transformer(
+        *base_transformers(),
         (
             preprocessing.KBinsDiscretizer(encode="ordinal"),
             ["PURCHASE_VALUE", "USER_INCOME"],
         ),
-        (encoders["ordinal"], ["MERCHANT_NAME", "USER_ID"]),
-        n_jobs=config.N_JOBS,
-        verbose=config.VERBOSE,
-    ),
-    # add ordinal encoded merchant name and user id to `c3`
-    "c6": compose.make_column_transformer(
-        (DatetimeFeatures(features_to_extract=DATETIME_FEATURES), ["PURCHASED_AT"]),
-        (gender_pipe, ["USER_GENDER"]),
+        (encoders["categorical"], ["MERCHANT_NAME", "USER_ID"]),
+    )
+
+
+def c6():
+    """Add the category codes of merchant name and user id to `c3`"""
+    from feature_engine.transformation import LogTransformer
+    from sklearn import preprocessing
+
+    return make_column_transformer(
+        *base_transformers(),
+        (preprocessing.KBinsDiscretizer(encode="ordinal"), ["PURCHASE_VALUE"]),
+        (LogTransformer(), ["USER_INCOME"]),
+        (encoders["categorical"], ["MERCHANT_NAME", "USER_ID"]),
+    )
+
+
+def nc4():
+    """`c4` with merchant name and user id passed to the model as categoricals"""
+    return make_column_transformer(
+        *base_transformers(pandas_output=True),
+        (encoders["native"], ["MERCHANT_NAME", "USER_ID"]),
+    ).set_output(transform="pandas")
+
+
+def nc5():
+    """`c5` with merchant name and user id passed to the model as categoricals"""
+    from sklearn import preprocessing
+
+    return make_column_transformer(
+        *base_transformers(pandas_output=True),
         (
-            IdentityTransformer(),
-            ["IS_PURCHASE_PAID_VIA_MPESA_SEND_MONEY", "USER_HOUSEHOLD"],
+            preprocessing.KBinsDiscretizer(encode="ordinal"),
+            ["PURCHASE_VALUE", "USER_INCOME"],
         ),
+        (encoders["native"], ["MERCHANT_NAME", "USER_ID"]),
+    ).set_output(transform="pandas")
+
+
+def nc6():
+    """`c6` with merchant name and user id passed to the model as categoricals"""
+    from feature_engine.transformation import LogTransformer
+    from sklearn import preprocessing
+
+    return make_column_transformer(
+        *base_transformers(pandas_output=True),
         (preprocessing.KBinsDiscretizer(encode="ordinal"), ["PURCHASE_VALUE"]),
         (LogTransformer(), ["USER_INCOME"]),
-        (encoders["ordinal"], ["MERCHANT_NAME", "USER_ID"]),
-        n_jobs=config.N_JOBS,
-        verbose=config.VERBOSE,
-    ),
-    "n1": compose.make_column_transformer(
+        (encoders["native"], ["MERCHANT_NAME", "USER_ID"]),
+    ).set_output(transform="pandas")
+
+
+# the `n*` preprocessors output sparse matrices, which are only densified for
+# models that don't support them
+def n1():
+    """Word counts of merchant name"""
+    return make_column_transformer(
+        (vectorizers["count"], "MERCHANT_NAME"), sparse_threshold=1
+    )
+
+
+def n2():
+    """Hashed character n-grams of merchant name"""
+    return make_column_transformer(
+        (vectorizers["hashing"], "MERCHANT_NAME"), sparse_threshold=1
+    )
+
+
+def c4n1():
+    """Combine `c4` and `n1` in a sparse matrix"""
+    return make_column_transformer(
+        *base_transformers(),
+        (encoders["categorical"], ["MERCHANT_NAME", "USER_ID"]),
         (vectorizers["count"], "MERCHANT_NAME"),
-        sparse_threshold=0,
-        n_jobs=config.N_JOBS,
-        verbose=config.VERBOSE,
-    ),
-}
+        sparse_threshold=1,
+    )
+
+
+def c4n2():
+    """Combine `c4` and `n2` in a sparse matrix"""
+    return make_column_transformer(
+        *base_transformers(),
+        (encoders["categorical"], ["MERCHANT_NAME", "USER_ID"]),
+        (vectorizers["hashing"], "MERCHANT_NAME"),
+        sparse_threshold=1,
+    )
+
+
+# preprocessors are created, and their dependencies imported, on first use
+preprocessors = LazyRegistry(
+    {
+        "c1": c1,
+        "c2": c2,
+        "c3": c3,
+        "c4": c4,
+        "c5": c5,
+        "c6": c6,
+        "nc4": nc4,
+        "nc5": nc5,
+        "nc6": nc6,
+        "n1": n1,
+        "n2": n2,
+        "c4n1": c4n1,
+        "c4n2": c4n2,
+    }
+)
@@ -0,0 +1,192 @@
+import contextlib
+import cProfile
+import datetime
+import functools
+import json
+import logging
+import resource
+import sys
+import threading
+import time
+
+from . import config
+
+# logger
+logger = logging.getLogger(__name__)
+
+# spans are only collected by threads running `profile_run` or `record`
+_local = threading.local()
+
+
+def get_peak_rss() -> float:
+    """Get the peak resident memory of the current process in MB"""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak_rss / 1024**2 if sys.platform == "darwin" else peak_rss / 1024
+
+
+@contextlib.contextmanager
+def span(name: str):
+    """Measure the wall time, CPU time and peak memory of a block of code.
+
+    Spans opened inside another span are recorded as its children.
+    """
+    stack = getattr(_local, "stack", None)
+    node = {"name": name, "children": []}
+    if stack is not None:
+        stack[-1]["children"].append(node)
+        stack.append(node)
+
+    start_time = time.perf_counter()
+    start_cpu_time = time.process_time()
+    try:
+        yield node
+    finally:
+        node["wall_time"] = time.perf_counter() - start_time
+        node["cpu_time"] = time.process_time() - start_cpu_time
+        node["peak_rss_mb"] = get_peak_rss()
+        if stack is not None:
+            stack.pop()
+
+
+def profile(func):
+    """Record the decorated function as a span and log its runtime"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__name__) as node:
+            value = func(*args, **kwargs)
+        logger.info(
+            f"Finished {func.__name__!r} in {node['wall_time']:.4f} seconds "
+            f"({node['cpu_time']:.4f} CPU seconds, {node['peak_rss_mb']:.1f} MB peak)"
+        )
+        return value
+
+    return wrapper
+
+
+def record(func, *args, **kwargs) -> tuple:
+    """Call a function and collect its spans, e.g. in a worker process.
+
+    Returns the value of the function and its spans, which can be added to the
+    span tree of the parent with `attach`.
+    """
+    previous_stack = getattr(_local, "stack", None)
+    collector = {"children": []}
+    _local.stack = [collector]
+    try:
+        value = func(*args, **kwargs)
+    finally:
+        _local.stack = previous_stack
+    return value, collector["children"]
+
+
+def attach(spans: list) -> None:
+    """Add spans collected by `record` to the current span"""
+    stack = getattr(_local, "stack", None)
+    if stack is not None:
+        stack[-1]["children"].extend(spans)
+
+
+def summarize(spans: list, prefix="", summary=None) -> dict:
+    """Aggregate the spans by their path, e.g. `train/cross_validate/fit_fold`"""
+    summary = {} if summary is None else summary
+    for node in spans:
+        path = f"{prefix}/{node['name']}" if prefix else node["name"]
+        stats = summary.setdefault(
+            path, {"calls": 0, "wall_time": 0.0, "cpu_time": 0.0, "peak_rss_mb": 0.0}
+        )
+        stats["calls"] += 1
+        stats["wall_time"] += node["wall_time"]
+        stats["cpu_time"] += node["cpu_time"]
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], node["peak_rss_mb"])
+        summarize(node["children"], path, summary)
+    return summary
+
+
+def to_folded(spans: list, prefix="") -> list:
+    """Convert spans to the collapsed stack format read by flame graph tools.
+
+    Each line holds a `;` separated stack and its self time in microseconds, the
+    same format as `py-spy record --format raw`.
+    """
+    lines = []
+    for node in spans:
+        stack = f"{prefix};{node['name']}" if prefix else node["name"]
+        children_time = sum(child["wall_time"] for child in node["children"])
+        self_time = max(node["wall_time"] - children_time, 0)
+        lines.append(f"{stack} {round(self_time * 1e6)}")
+        lines.extend(to_folded(node["children"], stack))
+    return lines
+
+
+def save_profile(spans: list, profiler, name: str):
+    """Save the span tree, its flame graph stacks and the cProfile stats"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    profile_dir = config.PROFILE_DIR / f"{name}-{timestamp}"
+    profile_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(profile_dir / "spans.json", "w") as file:
+        json.dump(spans, file, indent=2)
+    with open(profile_dir / "spans.folded", "w") as file:
+        file.write("\n".join(to_folded(spans)) + "\n")
+    if profiler is not None:
+        profiler.dump_stats(profile_dir / "profile.prof")
+
+    logger.info(f"Profile saved to {str(profile_dir)!r}")
+    return profile_dir
+
+
+def set_run(run_id: str) -> None:
+    """Set the MLflow run that the profile of the current command is logged to.
+
+    The first run started by the command is kept, e.g. the parent run of a sweep.
+    """
+    if getattr(_local, "run_id", None) is None:
+        _local.run_id = run_id
+
+
+def log_profile(spans: list, profile_dir, run_id: str, name: str) -> None:
+    """Log the profile of a command as artifacts and metrics of an MLflow run.
+
+    They are logged under `profile/<command>`, so that the profile of a command
+    never replaces the profile of another command logged to the same run.
+    """
+    from .tracking import RunLogger
+
+    metrics = {}
+    for path, stats in summarize(spans).items():
+        for stat, value in stats.items():
+            metrics[f"profile/{name}/{path}/{stat}"] = value
+
+    # the run has already ended, so the profile is logged without resuming it
+    run_logger = RunLogger(run_id)
+    run_logger.log_metrics(metrics)
+    run_logger.close()
+    run_logger.client.log_artifacts(run_id, str(profile_dir), f"profile/{name}")
+
+
+@contextlib.contextmanager
+def profile_run(name: str):
+    """Collect the spans of a command and export them when it finishes.
+
+    The spans are logged to the run set by `set_run`, if any. If `PROFILE` is set,
+    the command is also profiled with cProfile.
+    """
+    profiler = cProfile.Profile() if config.PROFILE else None
+    collector = {"children": []}
+    _local.stack = [collector]
+    _local.run_id = None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with span("cli"):
+            yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _local.stack = None
+
+    profile_dir = save_profile(collector["children"], profiler, name)
+    if _local.run_id is not None:
+        log_profile(collector["children"], profile_dir, _local.run_id, name)
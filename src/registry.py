@@ -0,0 +1,31 @@
+import importlib
+from collections.abc import Mapping
+
+
+def lazy(module: str, name: str, **params):
+    """Create a factory that imports a class on first use and instantiates it"""
+
+    def factory():
+        cls = getattr(importlib.import_module(module), name)
+        return cls(**params)
+
+    return factory
+
+
+class LazyRegistry(Mapping):
+    """A mapping whose values are built by their factories on first access"""
+
+    def __init__(self, factories: dict):
+        self._factories = factories
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values[key] = self._factories[key]()
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
@@ -0,0 +1,74 @@
+import contextlib
+import logging
+
+import joblib
+from threadpoolctl import threadpool_limits
+
+from . import config
+
+# logger
+logger = logging.getLogger(__name__)
+
+
+def get_core_budget(n_cores=None) -> int:
+    """Get the number of cores available to a command, `N_JOBS` by default"""
+    return joblib.effective_n_jobs(config.N_JOBS if n_cores is None else n_cores)
+
+
+def split_cores(n_cores: int, n_workers: int) -> tuple:
+    """Split a core budget between parallel workers and their threads."""
+    n_workers = max(1, min(n_workers, n_cores))
+    return n_workers, max(1, n_cores // n_workers)
+
+
+def allocate(
+    n_tasks: int, n_cores=None, n_workers=None, name="tasks", n_single_threaded=0
+) -> dict:
+    """Assign the cores of the budget to the levels of nested parallelism.
+
+    Independent tasks, e.g. cross-validation folds or tuning trials, run in worker
+    processes, and each worker gets an equal share of the cores for its column
+    transformers, model threads and BLAS/OpenMP thread pools. The column
+    transformers and the model never run at the same time, so they share it.
+
+    If `n_single_threaded` of the tasks fit single-threaded models, they get a
+    single thread, and the cores they leave are shared by the tasks running
+    alongside them.
+    """
+    n_cores = get_core_budget(n_cores)
+    n_workers, n_threads = split_cores(n_cores, n_workers or n_tasks)
+
+    # the expected number of workers running single-threaded tasks at a time
+    n_single_workers = n_workers * n_single_threaded / n_tasks if n_tasks else 0
+    if n_single_threaded and n_single_workers < n_workers:
+        n_threads = max(
+            1, int((n_cores - n_single_workers) // (n_workers - n_single_workers))
+        )
+
+    allocation = {"cores": n_cores, "workers": n_workers, "threads": n_threads}
+    message = (
+        f"Running {n_tasks} {name} on {n_cores} core(s): {n_workers} worker(s) "
+        f"with {n_threads} thread(s) each for column transformers and models"
+    )
+    if n_single_threaded:
+        message += f", and 1 thread for the {n_single_threaded} single-threaded ones"
+    logger.info(message)
+    return allocation
+
+
+@contextlib.contextmanager
+def limit_threads(n_threads: int):
+    """Limit the threads of a worker's column transformers and thread pools.
+
+    Column transformers use the number of jobs of the active joblib backend, and
+    the BLAS and OpenMP thread pools, e.g. of HistGradientBoosting, are capped
+    with threadpoolctl. The threads of models with an `n_jobs` or `thread_count`
+    parameter are set with `models.get_thread_params`.
+    """
+    if n_threads is None:
+        yield
+        return
+
+    with threadpool_limits(limits=n_threads):
+        with joblib.parallel_backend("threading", n_jobs=n_threads):
+            yield
@@ -0,0 +1,202 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from . import config, data, predict, utils
+
+# logger
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Coalesce concurrent prediction requests into micro-batches"""
+
+    def __init__(self, groups: list, max_batch_size=64, max_wait=0.005, n_jobs=1):
+        self.groups = groups
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.n_jobs = n_jobs
+
+        self.queue = queue.Queue()
+
+        # the statistics are updated by the batching thread and read by the handlers
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=10_000)
+        self.n_requests = 0
+        self.n_batches = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, record: dict) -> Future:
+        """Queue a transaction for prediction"""
+        future = Future()
+        self.queue.put((record, future, time.perf_counter()))
+        return future
+
+    def next_batch(self) -> list:
+        """Wait for a request and collect the ones that follow it into a batch"""
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def predict_batch(self, records) -> list:
+        """Predict on a batch of transactions"""
+        df = data.from_records(records)
+        predictions, classes = predict.predict_proba(self.groups, df, self.n_jobs)
+        labels = classes[predictions.argmax(axis=1)]
+        return [
+            {
+                config.INDEX_COL: df.index[i],
+                config.TARGET_COL: labels[i],
+                "probabilities": dict(zip(classes, predictions[i])),
+            }
+            for i in range(len(df))
+        ]
+
+    def predict_record(self, record: dict):
+        """Predict on a single transaction, returning the error if it fails"""
+        try:
+            return self.predict_batch([record])[0]
+        except Exception as exc:
+            return exc
+
+    def run(self) -> None:
+        """Predict on micro-batches of queued requests"""
+        while True:
+            batch = self.next_batch()
+            records, futures, start_times = zip(*batch)
+            try:
+                results = self.predict_batch(records)
+            except Exception as exc:
+                results = [exc]
+                if len(records) > 1:
+                    # a bad record fails the whole batch, so the records are retried
+                    # one by one to only fail the request that sent it
+                    results = [self.predict_record(record) for record in records]
+
+            end_time = time.perf_counter()
+            for future, result, start_time in zip(futures, results, start_times):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+            with self.lock:
+                self.latencies.extend(end_time - start for start in start_times)
+                self.n_requests += len(batch)
+                self.n_batches += 1
+
+    def stats(self) -> dict:
+        """Summarize the latency of recent requests and the queue depth"""
+        with self.lock:
+            latencies = list(self.latencies)
+            n_requests, n_batches = self.n_requests, self.n_batches
+
+        stats = {
+            "queue_depth": self.queue.qsize(),
+            "n_requests": n_requests,
+            "n_batches": n_batches,
+        }
+        if n_batches:
+            latencies = np.array(latencies) * 1000
+            stats["p50_latency_ms"] = np.percentile(latencies, 50)
+            stats["p99_latency_ms"] = np.percentile(latencies, 99)
+            stats["mean_batch_size"] = n_requests / n_batches
+        return stats
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """Handle JSON prediction requests"""
+
+    batcher: MicroBatcher = None
+
+    def send_json(self, obj, status=200) -> None:
+        body = json.dumps(obj, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self.send_json({"status": "ok"})
+        elif self.path == "/metrics":
+            self.send_json(self.batcher.stats())
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self) -> None:
+        if self.path != "/predict":
+            self.send_json({"error": "not found"}, status=404)
+            return
+
+        # accept a single transaction or a list of transactions
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+        except ValueError as exc:
+            self.send_json({"error": f"invalid JSON: {exc}"}, status=400)
+            return
+        records = payload if isinstance(payload, list) else [payload]
+
+        futures = [self.batcher.submit(record) for record in records]
+        try:
+            results = [future.result() for future in futures]
+        except Exception as exc:
+            self.send_json({"error": str(exc)}, status=400)
+            return
+        self.send_json(results if isinstance(payload, list) else results[0])
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(format % args)
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """HTTP server that accepts bursts of concurrent connections"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(
+    run_id: str,
+    host="127.0.0.1",
+    port=8000,
+    max_batch_size=64,
+    max_wait=5,
+    n_jobs=1,
+) -> None:
+    """Serve the fold ensemble of a run over HTTP."""
+    # load the models once
+    estimators = utils.load_models(run_id)
+    groups = predict.group_estimators(estimators)
+
+    PredictionHandler.batcher = MicroBatcher(
+        groups, max_batch_size, max_wait / 1000, n_jobs
+    )
+    server = PredictionServer((host, port), PredictionHandler)
+    logger.info(f"Serving run {run_id!r} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Server stats: {PredictionHandler.batcher.stats()}")
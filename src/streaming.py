@@ -0,0 +1,297 @@
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+from sklearn.pipeline import Pipeline
+
+from . import boosting, config, data, models, preprocessors, profiling, transformers
+
+# logger
+logger = logging.getLogger(__name__)
+
+# models that can be trained on data streamed from disk
+streaming_models = ["lgb", "xgb"]
+
+
+def make_sequence(array: np.memmap, batch_size: int):
+    """Create a sequence of the rows of a memory-mapped array for LightGBM"""
+    import lightgbm
+
+    class MemmapSequence(lightgbm.Sequence):
+        def __init__(self):
+            self.batch_size = batch_size
+
+        def __getitem__(self, idx):
+            # LightGBM samples the rows of sequences as doubles
+            return np.asarray(array[idx], dtype=np.float64)
+
+        def __len__(self) -> int:
+            return len(array)
+
+    return MemmapSequence()
+
+
+def make_data_iter(array: np.memmap, label: np.ndarray, batch_size: int, cache_prefix):
+    """Create an iterator over batches of a memory-mapped array for XGBoost"""
+    import xgboost
+
+    class MemmapIter(xgboost.DataIter):
+        def __init__(self):
+            self._start = 0
+            super().__init__(cache_prefix=cache_prefix)
+
+        def next(self, input_data) -> int:
+            if self._start >= len(array):
+                return 0
+            batch = slice(self._start, self._start + batch_size)
+            input_data(data=array[batch], label=label[batch])
+            self._start = batch.stop
+            return 1
+
+        def reset(self) -> None:
+            self._start = 0
+
+    return MemmapIter()
+
+
+def read_labels(data_path) -> tuple:
+    """Read the target column of a CSV file as integer codes and their classes"""
+    y = pd.read_csv(data_path, usecols=[config.TARGET_COL], dtype="category")
+    y = y[config.TARGET_COL]
+    return y.cat.codes.to_numpy(), y.cat.categories.to_numpy()
+
+
+def assign_folds(codes: np.ndarray, n_folds: int) -> np.ndarray:
+    """Assign each row to the fold in which it's used for validation.
+
+    The folds are the same as those of `config.CV_SPLITTER` on the full data, but
+    only the row positions and labels are kept in memory.
+    """
+    splitter = StratifiedKFold(
+        n_splits=n_folds, shuffle=True, random_state=config.RANDOM_SEED
+    )
+    fold_ids = np.empty(len(codes), dtype=np.int8)
+    for fold, (_, val_idx) in enumerate(splitter.split(np.zeros(len(codes)), codes)):
+        fold_ids[val_idx] = fold
+    return fold_ids
+
+
+def iter_chunks(data_path, chunksize: int):
+    """Iterate over the features of a CSV file in chunks with their row positions"""
+    start = 0
+    for chunk in data.read_csv(data_path, chunksize=chunksize):
+        positions = np.arange(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk.drop(config.TARGET_COL, axis=1), positions
+
+
+@profiling.profile
+def fit_preprocessors(
+    preprocessor: str, data_path, chunksize: int, fold_ids: np.ndarray, codes
+) -> list:
+    """Fit a preprocessor per fold on a random sample of its training rows.
+
+    The categories of all the training rows are added to the categorical encoders
+    afterwards, so that no category seen in training is encoded as unknown.
+    """
+    n_folds = fold_ids.max() + 1
+    rng = np.random.default_rng(config.RANDOM_SEED)
+    sample_size = min(config.OUT_OF_CORE_SAMPLE_SIZE, len(fold_ids))
+    sample_positions = np.sort(rng.choice(len(fold_ids), sample_size, replace=False))
+
+    # a single pass collects the sample and the categories of each fold
+    samples = []
+    categories = [{} for _ in range(n_folds)]
+    for X, positions in iter_chunks(data_path, chunksize):
+        samples.append(X[np.isin(positions, sample_positions)])
+        categorical_cols = [col for col in config.CATEGORICAL_COLS if col in X]
+        for fold in range(n_folds):
+            X_train = X.loc[fold_ids[positions] != fold, categorical_cols]
+            for col, column in X_train.items():
+                values = transformers.get_categories(column)
+                known = categories[fold].get(col, values)
+                categories[fold][col] = np.union1d(known, values)
+    X_sample = pd.concat(samples)
+
+    fitted = []
+    for fold in range(n_folds):
+        train_mask = fold_ids[sample_positions] != fold
+        transformer = clone(preprocessors.preprocessors[preprocessor])
+        transformer.fit(X_sample[train_mask], codes[sample_positions][train_mask])
+
+        X_categories = pd.DataFrame(
+            {
+                col: pd.Series(values, dtype="category")
+                for col, values in categories[fold].items()
+            }
+        )
+        n_new_categories = transformers.extend_categories(transformer, X_categories)
+        logger.info(f"Fold {fold}: {n_new_categories} categories not in the sample")
+        fitted.append(transformer)
+    return fitted
+
+
+def check_transformed(preprocessor: str, X) -> None:
+    """Check that a preprocessor outputs dense numeric arrays"""
+    if sparse.issparse(X) or isinstance(X, pd.DataFrame):
+        raise ValueError(
+            f"Out-of-core training requires a preprocessor with dense array output, "
+            f"{preprocessor!r} outputs {type(X).__name__}"
+        )
+
+
+@profiling.profile
+def transform_folds(
+    preprocessor: str,
+    transformers_: list,
+    data_path,
+    chunksize: int,
+    fold_ids: np.ndarray,
+    temp_dir: Path,
+) -> list:
+    """Transform the training and validation rows of each fold to memory-mapped files"""
+    arrays = []
+    for fold in range(len(transformers_)):
+        n_val = int(np.sum(fold_ids == fold))
+        arrays.append({"train": len(fold_ids) - n_val, "val": n_val})
+
+    offsets = [{"train": 0, "val": 0} for _ in transformers_]
+    for X, positions in iter_chunks(data_path, chunksize):
+        for fold, transformer in enumerate(transformers_):
+            val_mask = fold_ids[positions] == fold
+            for split, mask in (("train", ~val_mask), ("val", val_mask)):
+                if not mask.any():
+                    continue
+                X_split = transformer.transform(X[mask])
+                check_transformed(preprocessor, X_split)
+
+                # the files are created once the number of features is known
+                if not isinstance(arrays[fold][split], np.memmap):
+                    arrays[fold][split] = np.memmap(
+                        temp_dir / f"fold_{fold}_{split}.dat",
+                        dtype=np.float32,
+                        mode="w+",
+                        shape=(arrays[fold][split], X_split.shape[1]),
+                    )
+
+                start = offsets[fold][split]
+                arrays[fold][split][slice(start, start + len(X_split))] = X_split
+                offsets[fold][split] += len(X_split)
+
+    for fold_arrays in arrays:
+        for array in fold_arrays.values():
+            array.flush()
+    return arrays
+
+
+def fit_booster(
+    model: str,
+    params: dict,
+    X: np.memmap,
+    y: np.ndarray,
+    n_classes: int,
+    batch_size: int,
+    temp_dir: Path,
+):
+    """Train a booster on a memory-mapped array with the native API of its library"""
+    estimator = clone(models.models[model]).set_params(**(params or {}))
+    booster_params = boosting.get_booster_params(model, estimator, n_classes)
+    n_estimators = estimator.get_params()["n_estimators"]
+
+    if model == "xgb":
+        import xgboost
+
+        data_iter = make_data_iter(X, y, batch_size, str(temp_dir / "xgb"))
+        dtrain = xgboost.DMatrix(data_iter, missing=np.nan)
+        return xgboost.train(booster_params, dtrain, num_boost_round=n_estimators)
+
+    import lightgbm
+
+    dtrain = lightgbm.Dataset(make_sequence(X, batch_size), label=y)
+    return lightgbm.train(booster_params, dtrain, num_boost_round=n_estimators)
+
+
+def log_loss(estimator, X: np.memmap, y: np.ndarray, batch_size: int) -> float:
+    """Compute the negated log loss of a classifier on batches of an array"""
+    eps = 1e-15
+    total = 0.0
+    for start in range(0, len(X), batch_size):
+        batch = slice(start, start + batch_size)
+        proba = np.clip(estimator.predict_proba(X[batch]), eps, 1 - eps)
+        proba /= proba.sum(axis=1, keepdims=True)
+        labels = y[batch]
+        total -= np.log(proba[np.arange(len(labels)), labels]).sum()
+    return -total / len(X)
+
+
+@profiling.profile
+def cross_validate(
+    model: str, preprocessor: str, data_path, chunksize: int, params=None
+) -> dict:
+    """Evaluate a model with cross-validation on data streamed from disk in chunks.
+
+    Only the labels and fold assignments of the rows are kept in memory, the
+    transformed folds are written to memory-mapped files that the boosters read in
+    batches. Returns the results in the same format as `cv.cross_validate`.
+    """
+    if model not in streaming_models:
+        raise ValueError(f"Out-of-core training is not supported for {model!r}")
+    unsupported = set(config.EVAL_METRICS) - {"neg_log_loss"}
+    if unsupported:
+        raise ValueError(f"Unsupported out-of-core metrics: {sorted(unsupported)}")
+
+    codes, classes = read_labels(data_path)
+    fold_ids = assign_folds(codes, config.NUM_FOLDS)
+    transformers_ = fit_preprocessors(
+        preprocessor, data_path, chunksize, fold_ids, codes
+    )
+
+    if not config.CACHE_DIR.exists():
+        config.CACHE_DIR.mkdir(parents=True)
+
+    fold_results = []
+    with tempfile.TemporaryDirectory(dir=config.CACHE_DIR) as temp_dir:
+        temp_dir = Path(temp_dir)
+        arrays = transform_folds(
+            preprocessor, transformers_, data_path, chunksize, fold_ids, temp_dir
+        )
+
+        for fold, transformer in enumerate(transformers_):
+            y_train, y_val = codes[fold_ids != fold], codes[fold_ids == fold]
+            X_train, X_val = arrays[fold]["train"], arrays[fold]["val"]
+
+            start_time = time.perf_counter()
+            with profiling.span("fit"):
+                booster = fit_booster(
+                    model, params, X_train, y_train, len(classes), chunksize, temp_dir
+                )
+            estimator = boosting.BoosterClassifier(booster, classes)
+            results = {"fit_time": time.perf_counter() - start_time}
+
+            start_time = time.perf_counter()
+            with profiling.span("score"):
+                results["test_neg_log_loss"] = log_loss(
+                    estimator, X_val, y_val, chunksize
+                )
+                results["train_neg_log_loss"] = log_loss(
+                    estimator, X_train, y_train, chunksize
+                )
+            results["score_time"] = time.perf_counter() - start_time
+
+            results["estimator"] = Pipeline(
+                [(preprocessor, transformer), (model, estimator)],
+                verbose=config.VERBOSE,
+            )
+            fold_results.append(results)
+
+    cv_results = {}
+    for key in fold_results[0]:
+        values = [result[key] for result in fold_results]
+        cv_results[key] = values if key == "estimator" else np.array(values)
+    return cv_results
@@ -0,0 +1,183 @@
+import datetime
+import itertools
+import logging
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import Pipeline
+
+from . import (
+    cache,
+    config,
+    cv,
+    data,
+    models,
+    preprocessors,
+    profiling,
+    scheduler,
+    tracking,
+    train,
+)
+
+# logger
+logger = logging.getLogger(__name__)
+
+SWEEP_DIR = config.OUTPUT_DIR / "sweeps"
+
+
+def fit_task(model: str, preprocessor: str, *args, **kwargs) -> dict:
+    """Fit a fold of a combination, returning the error instead of raising it.
+
+    A failing combination, e.g. a model that doesn't support the output of a
+    preprocessor, doesn't stop the other combinations of the sweep.
+    """
+    try:
+        return cv.fit_fold(model, preprocessor, *args, **kwargs)
+    except Exception as error:
+        message = str(error).splitlines()[0] if str(error) else ""
+        return {"error": f"{type(error).__name__}: {message}"}
+
+
+@profiling.profile
+def log_combination(model: str, preprocessor: str, fold_results: list) -> dict:
+    """Log the cross-validation results of a combination as an MLflow run"""
+    tags = {"model": model, "preprocessor": preprocessor, "n_folds": config.NUM_FOLDS}
+    with tracking.start_run(
+        run_name=f"{model}+{preprocessor}+{config.NUM_FOLDS}", tags=tags, nested=True
+    ) as run_logger:
+        entry = {
+            "model": model,
+            "preprocessor": preprocessor,
+            "run_id": run_logger.run_id,
+        }
+        errors = [result["error"] for result in fold_results if "error" in result]
+        if errors:
+            run_logger.set_tags({"error": errors[0]})
+            logger.warning(f"{model}+{preprocessor} failed: {errors[0]}")
+            return {**entry, "error": errors[0]}
+
+        pipe = Pipeline(
+            [
+                (preprocessor, preprocessors.preprocessors[preprocessor]),
+                (model, models.models[model]),
+            ]
+        )
+        run_logger.log_params(pipe.get_params())
+
+        cv_results = {
+            key: np.array([result[key] for result in fold_results])
+            for key in fold_results[0]
+            if key != "estimator"
+        }
+        train.log_metrics(cv_results, run_logger)
+        train.save_models([result["estimator"] for result in fold_results], run_logger)
+
+        summary = train.summarize_metrics(cv_results)
+        for metric, value in summary.loc["mean"].items():
+            entry[metric] = value
+        return entry
+
+
+@profiling.profile
+def sweep(
+    model_names: list,
+    preprocessor_names: list,
+    data_path="",
+    n_workers=None,
+    n_cores=None,
+) -> pd.DataFrame:
+    """Cross-validate every combination of models and preprocessors.
+
+    The data is loaded once and the fold fits of all the combinations are run as
+    independent tasks on a single process pool. The numeric and categorical columns
+    are memory-mapped into the workers instead of being copied. Each combination is
+    logged as a child run of the sweep, and the results are ranked in a leaderboard.
+    """
+    if not data_path:
+        data_path = config.TRAIN_DATA
+
+    train_df = data.load_data(data_path)
+    X = train_df.drop(config.TARGET_COL, axis=1)
+    y = train_df[config.TARGET_COL]
+    data_hash = data.hash_frame(X, y)
+    folds = list(config.CV_SPLITTER.split(X, y))
+
+    # the tasks of multi-threaded models share the cores that the tasks of
+    # single-threaded models, e.g. decision trees, don't use
+    combinations = list(itertools.product(model_names, preprocessor_names))
+    n_tasks = len(combinations) * len(folds)
+    threaded = {model: models.is_multithreaded(model) for model in model_names}
+    n_single_threaded = sum(not threaded[model] for model, _ in combinations)
+    allocation = scheduler.allocate(
+        n_tasks,
+        n_cores,
+        n_workers,
+        name="fold fits",
+        n_single_threaded=n_single_threaded * len(folds),
+    )
+    n_workers = allocation["workers"]
+
+    # the tasks are ordered by preprocessor, so that folds transformed by the
+    # first model are reused from the transform cache by the next ones
+    tasks = [
+        (model, preprocessor, train_idx, val_idx)
+        for preprocessor in preprocessor_names
+        for model in model_names
+        for train_idx, val_idx in folds
+    ]
+    parallel = joblib.Parallel(n_jobs=n_workers, verbose=config.VERBOSITY)
+    task_results = parallel(
+        joblib.delayed(profiling.record)(
+            fit_task,
+            model,
+            preprocessor,
+            X,
+            y,
+            train_idx,
+            val_idx,
+            data_hash,
+            n_threads=allocation["threads"] if threaded[model] else 1,
+        )
+        for model, preprocessor, train_idx, val_idx in tasks
+    )
+    cache.evict()
+
+    combination_results = {}
+    for (model, preprocessor, _, _), (results, spans) in zip(tasks, task_results):
+        combination_results.setdefault((model, preprocessor), []).append(results)
+        profiling.attach(spans)
+
+    tags = {"n_folds": config.NUM_FOLDS, "n_workers": n_workers}
+    with tracking.start_run(
+        run_name=f"sweep+{config.NUM_FOLDS}", tags=tags
+    ) as run_logger:
+        run_logger.log_params(
+            {
+                "models": " ".join(model_names),
+                "preprocessors": " ".join(preprocessor_names),
+                "data_path": str(data_path),
+            }
+        )
+        leaderboard = pd.DataFrame(
+            [
+                log_combination(model, preprocessor, fold_results)
+                for (model, preprocessor), fold_results in combination_results.items()
+            ]
+        )
+
+        # rank the combinations by their first evaluation metric
+        metric = "test_" + config.EVAL_METRICS[0].replace("neg_", "")
+        if metric in leaderboard:
+            ascending = config.EVAL_METRICS[0].startswith("neg_")
+            leaderboard = leaderboard.sort_values(metric, ascending=ascending)
+        leaderboard = leaderboard.reset_index(drop=True)
+        logger.info(f"Sweep leaderboard:\n{leaderboard.to_string()}")
+
+        SWEEP_DIR.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        file = SWEEP_DIR / f"sweep-{timestamp}.csv"
+        leaderboard.to_csv(file, index=False)
+        run_logger.client.log_artifact(run_logger.run_id, str(file))
+        logger.info(f"Leaderboard saved to {str(file)!r}")
+    return leaderboard
@@ -0,0 +1,145 @@
+import contextlib
+import logging
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import mlflow
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.tracking import MlflowClient
+
+from . import profiling
+
+# logger
+logger = logging.getLogger(__name__)
+
+# the maximum number of params and tags in a single `log_batch` call
+MAX_PARAMS_PER_BATCH = 100
+
+MAX_METRICS_PER_BATCH = 1000
+
+# pip requirements inferred for models, by the types of their pipeline steps
+_requirements = {}
+
+
+def get_model_key(model) -> tuple:
+    """Get the types of a model's pipeline steps, which determine its requirements"""
+    steps = [step for _, step in model.steps] if hasattr(model, "steps") else [model]
+    return tuple(f"{type(step).__module__}.{type(step).__name__}" for step in steps)
+
+
+class RunLogger:
+    """Buffer the params, metrics and tags of a run and upload models in the background.
+
+    The buffered values are sent with a few `log_batch` calls instead of a round trip
+    to the tracking store per value, and the models are serialized and uploaded by a
+    worker thread while the run continues. `close` flushes both.
+    """
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.client = MlflowClient()
+        self._params = {}
+        self._metrics = {}
+        self._tags = {}
+        self._uploader = ThreadPoolExecutor(max_workers=1)
+        self._uploads = []
+
+    def log_params(self, params: dict) -> None:
+        """Log params, which are sent right away to show while the run lasts"""
+        self._params.update({key: str(value) for key, value in params.items()})
+        self.flush()
+
+    def log_metrics(self, metrics: dict, step=0) -> None:
+        self._metrics.update(
+            {(key, step): float(value) for key, value in metrics.items()}
+        )
+
+    def set_tags(self, tags: dict) -> None:
+        self._tags.update({key: str(value) for key, value in tags.items()})
+
+    @profiling.profile
+    def flush(self) -> None:
+        """Send the buffered values to the tracking store"""
+        timestamp = int(time.time() * 1000)
+        params = [Param(key, value) for key, value in self._params.items()]
+        tags = [RunTag(key, value) for key, value in self._tags.items()]
+        metrics = [
+            Metric(key, value, timestamp, step)
+            for (key, step), value in self._metrics.items()
+        ]
+        self._params, self._metrics, self._tags = {}, {}, {}
+
+        while params or tags or metrics:
+            self.client.log_batch(
+                self.run_id,
+                metrics=metrics[:MAX_METRICS_PER_BATCH],
+                params=params[:MAX_PARAMS_PER_BATCH],
+                tags=tags[:MAX_PARAMS_PER_BATCH],
+            )
+            metrics = metrics[MAX_METRICS_PER_BATCH:]
+            params = params[MAX_PARAMS_PER_BATCH:]
+            tags = tags[MAX_PARAMS_PER_BATCH:]
+
+    def _log_model(self, model, artifact_path: str) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / artifact_path
+            key = get_model_key(model)
+            mlflow.sklearn.save_model(
+                model, path, pip_requirements=_requirements.get(key)
+            )
+
+            # inferring the requirements loads the model in a subprocess, so they
+            # are inferred once and reused for models with the same steps
+            if key not in _requirements:
+                requirements = (path / "requirements.txt").read_text().splitlines()
+                _requirements[key] = [line for line in requirements if line]
+            self.client.log_artifacts(self.run_id, str(path), artifact_path)
+        logger.info(f"Uploaded {artifact_path!r} to run {self.run_id!r}")
+
+    def log_model(self, model, artifact_path: str) -> None:
+        """Serialize and upload a scikit-learn model in the background"""
+        self._uploads.append(
+            self._uploader.submit(self._log_model, model, artifact_path)
+        )
+
+    @profiling.profile
+    def wait(self) -> None:
+        """Wait for the uploads, raising the first error"""
+        uploads, self._uploads = self._uploads, []
+        for upload in uploads:
+            upload.result()
+
+    def close(self, suppress_errors=False) -> None:
+        """Flush the buffered values and wait for the uploads.
+
+        If `suppress_errors` is set, e.g. when the run already failed, the errors are
+        logged instead of raised, so that they don't replace the run's error.
+        """
+        try:
+            self.flush()
+            self.wait()
+        except Exception:
+            if not suppress_errors:
+                raise
+            logger.exception(f"Failed to close run {self.run_id!r}")
+        finally:
+            self._uploader.shutdown()
+
+
+@contextlib.contextmanager
+def start_run(**kwargs):
+    """Start an MLflow run with a logger that is flushed when the run ends.
+
+    The profile of the command is logged to the first run it starts.
+    """
+    with mlflow.start_run(**kwargs) as run:
+        profiling.set_run(run.info.run_id)
+        run_logger = RunLogger(run.info.run_id)
+        try:
+            yield run_logger
+        except BaseException:
+            run_logger.close(suppress_errors=True)
+            raise
+        run_logger.close()
@@ -1,11 +1,23 @@
 import logging
 
-import mlflow
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import cross_validate
+from sklearn.base import clone
 from sklearn.pipeline import Pipeline
 
-from . import config, models, preprocessors, utils
+from . import (
+    config,
+    cv,
+    data,
+    models,
+    params,
+    predict,
+    preprocessors,
+    profiling,
+    streaming,
+    tracking,
+    utils,
+)
 
 # logger
 logger = logging.getLogger(__name__)
@@ -27,41 +39,111 @@ def summarize_metrics(metrics: dict) -> pd.DataFrame:
     return summary.loc[["mean", "std"]]
 
 
-@utils.timer
-def log_metrics(metrics: dict) -> None:
+@profiling.profile
+def log_metrics(metrics: dict, run_logger: tracking.RunLogger) -> None:
     """Log cross-validation metrics."""
     summary = summarize_metrics(metrics)
-
-    # get the current run id
-    run_id = mlflow.active_run().info.run_id
+    run_id = run_logger.run_id
     logger.info(f"Cross validation results\nfor run {run_id!r}:\n{summary.T}")
 
     # log metrics to MLflow
     flat_summary = pd.json_normalize(summary.to_dict())
-    mlflow.log_metrics(flat_summary.loc[0].to_dict())
+    run_logger.log_metrics(flat_summary.loc[0].to_dict())
 
 
-@utils.timer
-def save_models(models: list) -> None:
-    """Save models as MLflow artifacts."""
+@profiling.profile
+def save_models(models: list, run_logger: tracking.RunLogger) -> None:
+    """Save models as MLflow artifacts in the background."""
     for fold, model in enumerate(models):
-        mlflow.sklearn.log_model(model, f"model_{fold}")
+        run_logger.log_model(model, f"model_{fold}")
+
+
+@profiling.profile
+def fit_single_model(
+    model: str, preprocessor: str, X, y, params=None, sample_weight=None
+) -> Pipeline:
+    """Fit a pipeline on the full training data."""
+    pipe = Pipeline(
+        [
+            (preprocessor, clone(preprocessors.preprocessors[preprocessor])),
+            (model, clone(models.models[model]).set_params(**(params or {}))),
+        ],
+        verbose=config.VERBOSE,
+    )
+    X_transformed = pipe[:-1].fit_transform(X, y)
+    densifier = cv.get_densifier(model, X_transformed)
+    if densifier is not None:
+        X_transformed = densifier.transform(X_transformed)
+        pipe.steps.insert(-1, ("densify", densifier))
+
+    categorical_params = models.get_categorical_params(model, pipe[-1], X_transformed)
+    fit_params = {} if sample_weight is None else {"sample_weight": sample_weight}
+    pipe[-1].set_params(**categorical_params).fit(X_transformed, y, **fit_params)
+    return pipe
+
+
+@profiling.profile
+def distill(
+    model: str,
+    preprocessor: str,
+    X,
+    y,
+    estimators: list,
+    params=None,
+    min_proba=1e-3,
+    top_k=3,
+) -> Pipeline:
+    """Fit a single student pipeline on the averaged probabilities of the fold models.
+
+    Each row is repeated for at most the `top_k` most probable classes according to
+    the fold models, among those with a probability above `min_proba`, weighted by
+    that probability. This keeps the student's training data under `top_k` times
+    the size of the original data.
+    """
+    proba, classes = predict.predict_proba(predict.group_estimators(estimators), X)
+    top_k = min(top_k, proba.shape[1])
+    top_classes = np.argpartition(-proba, top_k - 1, axis=1)[:, :top_k]
+    rows = np.repeat(np.arange(len(proba)), top_k)
+    cols = top_classes.ravel()
+    keep = proba[rows, cols] > min_proba
+    rows, cols = rows[keep], cols[keep]
+
+    X_soft = X.iloc[rows]
+    y_soft = pd.Series(classes[cols], index=X_soft.index, name=y.name).astype(y.dtype)
+    return fit_single_model(
+        model, preprocessor, X_soft, y_soft, params, sample_weight=proba[rows, cols]
+    )
 
 
-@utils.timer
-def train(model: str, preprocessor: str, data_path="") -> None:
-    """Train model."""
+@profiling.profile
+def train(
+    model: str,
+    preprocessor: str,
+    data_path="",
+    tuned_run_id=None,
+    chunksize=None,
+    single_model=None,
+) -> None:
+    """Train model.
+
+    If `chunksize` is given, the data is streamed from disk in chunks of that many
+    rows instead of being loaded into memory. If `single_model` is given, a single
+    model fitted on the full data, or distilled from the fold models, is saved
+    alongside them.
+    """
+    if single_model and chunksize:
+        raise ValueError("Single models aren't supported with out-of-core training")
+
     # load data
     if not data_path:
         data_path = config.TRAIN_DATA
 
-    train_df = pd.read_csv(
-        data_path, index_col=config.INDEX_COL, parse_dates=config.DATETIME_COLS
-    )
+    if not chunksize:
+        train_df = data.load_data(data_path)
 
-    # separate features from target
-    X = train_df.drop(config.TARGET_COL, axis=1)
-    y = train_df[config.TARGET_COL]
+        # separate features from target
+        X = train_df.drop(config.TARGET_COL, axis=1)
+        y = train_df[config.TARGET_COL]
 
     # create pipeline
     pipe = Pipeline(
@@ -72,31 +154,53 @@ def train(model: str, preprocessor: str, data_path="") -> None:
         verbose=config.VERBOSE,
     )
 
+    # use the hyperparameters found by a tuning run
+    tuned_params = {}
+    if tuned_run_id:
+        tuned_params = utils.load_params(tuned_run_id, model)
+        pipe.set_params(**tuned_params)
+
     tags = {"model": model, "preprocessor": preprocessor, "n_folds": config.NUM_FOLDS}
-    with mlflow.start_run(
+    if tuned_run_id:
+        tags["tuned_run_id"] = tuned_run_id
+    if chunksize:
+        tags["out_of_core"] = True
+    if single_model:
+        tags["single_model"] = single_model
+
+    with tracking.start_run(
         run_name=f"{model}+{preprocessor}+{config.NUM_FOLDS}",
         tags=tags,
-    ):
+    ) as run_logger:
         # log model parameters
-        for param, value in pipe.get_params().items():
-            mlflow.log_param(param, value)
+        run_logger.log_params(pipe.get_params())
 
         # cross validation
-        cv_results = cross_validate(
-            pipe,
-            X,
-            y,
-            scoring=config.EVAL_METRICS,
-            cv=config.CV_SPLITTER,
-            n_jobs=config.N_JOBS,
-            verbose=config.VERBOSITY,
-            return_estimator=True,
-            return_train_score=True,
-        )
+        if chunksize:
+            cv_results = streaming.cross_validate(
+                model,
+                preprocessor,
+                data_path,
+                chunksize,
+                params.strip_prefix(tuned_params),
+            )
+        else:
+            cv_results = cv.cross_validate(
+                model, preprocessor, X, y, params.strip_prefix(tuned_params)
+            )
         estimators = cv_results.pop("estimator")
 
         # log metrics
-        log_metrics(cv_results)
+        log_metrics(cv_results, run_logger)
 
         # save the models
-        save_models(estimators)
+        save_models(estimators, run_logger)
+
+        # collapse the fold models into a single model
+        if single_model:
+            model_params = params.strip_prefix(tuned_params)
+            if single_model == "full":
+                pipe = fit_single_model(model, preprocessor, X, y, model_params)
+            else:
+                pipe = distill(model, preprocessor, X, y, estimators, model_params)
+            run_logger.log_model(pipe, "model_single")
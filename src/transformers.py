@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import BaseEstimator, OneToOneFeatureMixin, TransformerMixin
+from sklearn.pipeline import Pipeline
+from sklearn.utils.validation import check_is_fitted
+
+
+def get_categories(column: pd.Series) -> np.ndarray:
+    """Get the sorted categories present in a column"""
+    if not isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype("category")
+    categories = column.cat.remove_unused_categories().cat.categories
+    return np.sort(categories.to_numpy())
+
+
+class BaseCategoricalEncoder(OneToOneFeatureMixin, TransformerMixin, BaseEstimator):
+    """Learn the sorted categories of categorical columns.
+
+    The encoders differ in how they encode the codes of the categories.
+    """
+
+    def fit(self, X, y=None):
+        X = pd.DataFrame(X)
+        self.n_features_in_ = X.shape[1]
+        if not isinstance(X.columns, pd.RangeIndex):
+            self.feature_names_in_ = X.columns.to_numpy(dtype=object)
+
+        self.categories_ = [get_categories(column) for _, column in X.items()]
+        return self
+
+    def partial_fit(self, X, y=None):
+        """Add the categories that weren't seen before after the known categories.
+
+        The codes of the known categories don't change, so that models fitted on
+        them can be trained further.
+        """
+        if not hasattr(self, "categories_"):
+            return self.fit(X, y)
+
+        X = pd.DataFrame(X)
+        for i, (_, column) in enumerate(X.items()):
+            categories = get_categories(column)
+            new_categories = categories[~np.isin(categories, self.categories_[i])]
+            self.categories_[i] = np.concatenate([self.categories_[i], new_categories])
+        return self
+
+
+class CategoricalEncoder(BaseCategoricalEncoder):
+    """Encode categorical columns as the codes of their sorted categories.
+
+    The codes match those of an `OrdinalEncoder`, but are obtained from the codes of
+    pandas categoricals instead of converting the columns to an object array.
+    Unknown categories are encoded as `unknown_value` and missing values as NaN.
+    """
+
+    def __init__(self, unknown_value=-999, dtype=np.float32):
+        self.unknown_value = unknown_value
+        self.dtype = dtype
+
+    def transform(self, X):
+        check_is_fitted(self)
+        X = pd.DataFrame(X)
+        X_out = np.empty(X.shape, dtype=self.dtype)
+        for i, (_, column) in enumerate(X.items()):
+            codes = pd.Categorical(column, categories=self.categories_[i]).codes
+            X_out[:, i] = codes
+
+            # codes are -1 for both unknown and missing values
+            missing = column.isna().to_numpy()
+            X_out[(codes == -1) & ~missing, i] = self.unknown_value
+            X_out[missing, i] = np.nan
+        return X_out
+
+
+class NativeCategoricalEncoder(BaseCategoricalEncoder):
+    """Encode categorical columns as categoricals of the codes of their categories.
+
+    The categories are the integer codes of the sorted categories seen in `fit`, so
+    that they are consistent between datasets, plus -1 for unknown and missing
+    values. Models with native categorical support split on them directly.
+    """
+
+    def transform(self, X):
+        check_is_fitted(self)
+        X = pd.DataFrame(X)
+        X_out = {}
+        for i, (col, column) in enumerate(X.items()):
+            # codes are -1 for both unknown and missing values
+            codes = pd.Categorical(column, categories=self.categories_[i]).codes
+            categories = pd.RangeIndex(-1, len(self.categories_[i]))
+            X_out[col] = pd.Categorical.from_codes(
+                codes.astype(np.int64) + 1, categories
+            )
+        return pd.DataFrame(X_out, index=X.index)
+
+
+# calendar features and the smallest integer dtype holding their values
+CALENDAR_FEATURES = {
+    "year": np.int16,
+    "month": np.int8,
+    "day_of_month": np.int8,
+    "day_of_week": np.int8,
+    "hour": np.int8,
+    "minute": np.int8,
+}
+
+NS_PER_MINUTE = 60 * 10**9
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_epoch_ns(column: pd.Series) -> np.ndarray:
+    """Get the nanoseconds since the epoch of the local times of a datetime column.
+
+    Columns parsed when the data is loaded are viewed as int64 without a copy, and
+    other columns are parsed once here.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(column):
+        column = pd.to_datetime(column)
+    if column.dt.tz is not None:
+        column = column.dt.tz_localize(None)
+    if column.isna().any():
+        raise ValueError(f"Column {column.name!r} contains missing datetimes")
+    return column.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def calendar_table(first_day: int, last_day: int) -> dict:
+    """Get the year, month and day of month of a range of days since the epoch"""
+    days = np.arange(first_day, last_day + 1).astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    return {
+        "year": days.astype("datetime64[Y]").astype(np.int64) + 1970,
+        "month": months.astype(np.int64) % 12 + 1,
+        "day_of_month": (days - months).astype(np.int64) + 1,
+    }
+
+
+class CalendarFeatures(TransformerMixin, BaseEstimator):
+    """Extract calendar features from datetime columns with NumPy.
+
+    The features of each column are computed in a single pass over its int64 epoch
+    values into a preallocated block of the smallest integer dtype holding them. The
+    year, month and day of month are looked up in a table of the days spanned by the
+    column. The features and their names match those of feature_engine's
+    `DatetimeFeatures`.
+    """
+
+    def __init__(self, features_to_extract=("month", "day_of_month")):
+        self.features_to_extract = features_to_extract
+
+    def fit(self, X, y=None):
+        X = pd.DataFrame(X)
+        unknown = set(self.features_to_extract) - set(CALENDAR_FEATURES)
+        if unknown:
+            raise ValueError(f"Unsupported calendar features: {sorted(unknown)}")
+
+        self.n_features_in_ = X.shape[1]
+        self.feature_names_in_ = X.columns.to_numpy(dtype=object)
+        return self
+
+    def get_feature_names_out(self, input_features=None):
+        check_is_fitted(self)
+        return np.array(
+            [
+                f"{col}_{feature}"
+                for col in self.feature_names_in_
+                for feature in self.features_to_extract
+            ],
+            dtype=object,
+        )
+
+    def transform(self, X):
+        check_is_fitted(self)
+        X = pd.DataFrame(X)
+        features = list(self.features_to_extract)
+        dtype = np.result_type(*[CALENDAR_FEATURES[feature] for feature in features])
+        X_out = np.empty((len(X), X.shape[1] * len(features)), dtype=dtype)
+        if not len(X):
+            return X_out
+
+        for i, (_, column) in enumerate(X.items()):
+            # whole minutes and days since the epoch, rounded towards the past
+            minutes = to_epoch_ns(column) // NS_PER_MINUTE
+            days = minutes // MINUTES_PER_DAY
+            minute_of_day = minutes - days * MINUTES_PER_DAY
+
+            table = None
+            if {"year", "month", "day_of_month"} & set(features):
+                first_day = days.min()
+                table = calendar_table(first_day, days.max())
+                day_idx = days - first_day
+
+            for j, feature in enumerate(features, start=i * len(features)):
+                if feature == "day_of_week":
+                    # the epoch is a Thursday, and Monday is 0
+                    X_out[:, j] = (days + 3) % 7
+                elif feature == "hour":
+                    X_out[:, j] = minute_of_day // 60
+                elif feature == "minute":
+                    X_out[:, j] = minute_of_day % 60
+                else:
+                    X_out[:, j] = table[feature][day_idx]
+        return X_out
+
+
+def to_dense(X):
+    """Convert a sparse matrix to a dense array"""
+    return X.toarray() if sparse.issparse(X) else X
+
+
+def to_float32(X) -> np.ndarray:
+    """Convert numeric columns, e.g. booleans and integers, to a float32 array"""
+    return np.asarray(X, dtype=np.float32)
+
+
+def extend_categories(preprocessor, X) -> int:
+    """Add the new categories of `X` to the categorical encoders of a preprocessor.
+
+    The other fitted transformers are kept as they are, so that the features of the
+    known data don't change. Returns the number of new categories.
+    """
+    n_categories = 0
+    for _, transformer, columns in getattr(preprocessor, "transformers_", []):
+        # only the first step of a pipeline sees the input columns
+        if isinstance(transformer, Pipeline):
+            transformer = transformer[0]
+        if not isinstance(transformer, BaseCategoricalEncoder):
+            continue
+
+        known_categories = list(transformer.categories_)
+        transformer.partial_fit(X[columns])
+
+        # the models were fitted on the codes of the known categories
+        for known, categories in zip(known_categories, transformer.categories_):
+            if not np.array_equal(categories[: len(known)], known):
+                raise ValueError("Extending the categories changed their codes")
+            n_categories += len(categories) - len(known)
+    return n_categories
@@ -0,0 +1,179 @@
+import contextlib
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+import joblib
+
+from . import config, models, params, preprocessors
+
+# logger
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    preprocessor TEXT NOT NULL,
+    params TEXT NOT NULL,
+    fold_spec TEXT NOT NULL,
+    data_hash TEXT NOT NULL,
+    value REAL NOT NULL,
+    user_attrs TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+def canonicalize(trial_params: dict) -> str:
+    """Serialize parameters so that equal configurations have the same string.
+
+    Floats are rounded to 10 significant digits, so that values that went through
+    different storages compare equal.
+    """
+    canonical = {
+        name: float(f"{value:.10g}") if isinstance(value, float) else value
+        for name, value in trial_params.items()
+    }
+    return json.dumps(canonical, sort_keys=True)
+
+
+def get_fold_spec(model: str, preprocessor: str, splitter=None, **kwargs) -> str:
+    """Describe the evaluation of a trial, which is part of its key.
+
+    The definitions of the model and preprocessor are hashed, so that results are not
+    reused once they change.
+    """
+    if splitter is None:
+        splitter = config.CV_SPLITTER
+    fold_spec = {
+        "model": joblib.hash(models.models[model]),
+        "preprocessor": joblib.hash(preprocessors.preprocessors[preprocessor]),
+        "splitter": repr(splitter),
+        "n_folds": splitter.get_n_splits(),
+        "random_seed": config.RANDOM_SEED,
+        "early_stopping_rounds": config.EARLY_STOPPING_ROUNDS,
+        "early_stopping_fraction": config.EARLY_STOPPING_FRACTION,
+        "metric": config.EVAL_METRICS[0],
+        **kwargs,
+    }
+    return json.dumps(fold_spec, sort_keys=True)
+
+
+def get_key(
+    model: str, preprocessor: str, trial_params: dict, fold_spec: str, data_hash: str
+) -> str:
+    """Get the key of a configuration evaluated on a dataset"""
+    key = [model, preprocessor, canonicalize(trial_params), fold_spec, data_hash]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def connect():
+    """Connect to the trial store, which is shared by the tuning workers"""
+    config.TRIAL_STORE.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(config.TRIAL_STORE, timeout=60)
+    try:
+        with connection:
+            connection.execute(SCHEMA)
+            yield connection
+    finally:
+        connection.close()
+
+
+def get_result(key: str):
+    """Get the objective value and user attributes of a configuration, if known"""
+    with connect() as connection:
+        row = connection.execute(
+            "SELECT value, user_attrs FROM trials WHERE key = ?", (key,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {"value": row[0], "user_attrs": json.loads(row[1])}
+
+
+def save_result(
+    key: str,
+    model: str,
+    preprocessor: str,
+    trial_params: dict,
+    fold_spec: str,
+    data_hash: str,
+    value: float,
+    user_attrs: dict,
+) -> None:
+    """Save the objective value of a configuration"""
+    with connect() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                model,
+                preprocessor,
+                canonicalize(trial_params),
+                fold_spec,
+                data_hash,
+                value,
+                json.dumps(user_attrs),
+                time.time(),
+            ),
+        )
+
+
+def find_results(model: str, preprocessor: str, fold_spec: str, data_hash: str):
+    """Get the known results of a model and preprocessor on a dataset"""
+    with connect() as connection:
+        rows = connection.execute(
+            "SELECT params, value, user_attrs FROM trials WHERE model = ? AND "
+            "preprocessor = ? AND fold_spec = ? AND data_hash = ?",
+            (model, preprocessor, fold_spec, data_hash),
+        ).fetchall()
+    return [
+        {
+            "params": json.loads(row[0]),
+            "value": row[1],
+            "user_attrs": json.loads(row[2]),
+        }
+        for row in rows
+    ]
+
+
+def seed_study(
+    study, model: str, preprocessor: str, fold_spec: str, data_hash: str
+) -> int:
+    """Add the known results of other studies to a study without evaluating them.
+
+    Returns the number of trials added. Results outside the current parameter space
+    of the model are skipped.
+    """
+    import optuna
+
+    distributions = params.get_params(model)
+    known = {
+        canonicalize(trial.params)
+        for trial in study.get_trials(
+            deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)
+        )
+    }
+
+    n_seeded = 0
+    for result in find_results(model, preprocessor, fold_spec, data_hash):
+        if canonicalize(result["params"]) in known:
+            continue
+        try:
+            trial = optuna.trial.create_trial(
+                params=result["params"],
+                distributions=distributions,
+                value=result["value"],
+                user_attrs={**result["user_attrs"], "cached": True},
+            )
+        except ValueError:
+            continue
+        study.add_trial(trial)
+        known.add(canonicalize(result["params"]))
+        n_seeded += 1
+
+    logger.info(f"Seeded study {study.study_name!r} with {n_seeded} known trial(s)")
+    return n_seeded
@@ -1,88 +1,403 @@
-import mlflow
+import logging
+import math
+
+import joblib
+import numpy as np
 import optuna
 import pandas as pd
+from sklearn import model_selection
 from sklearn.pipeline import Pipeline
 
-from . import config, models, params, preprocessors, utils
+from . import (
+    boosting,
+    cache,
+    config,
+    cv,
+    data,
+    models,
+    params,
+    preprocessors,
+    profiling,
+    scheduler,
+    tracking,
+    trials,
+)
+
+# logger
+logger = logging.getLogger(__name__)
+
+
+def subsample(y: pd.Series, fraction: float, min_count: int) -> np.ndarray:
+    """Get the positions of a stratified random fraction of the rows.
+
+    Every class keeps at least `min_count` rows, or all of its rows if it has fewer.
+    """
+    rng = np.random.default_rng(config.RANDOM_SEED)
+    codes = pd.factorize(y)[0]
+    positions = []
+    for code in np.unique(codes):
+        class_positions = np.flatnonzero(codes == code)
+        n_rows = max(min_count, round(fraction * len(class_positions)))
+        n_rows = min(n_rows, len(class_positions))
+        positions.append(rng.choice(class_positions, n_rows, replace=False))
+    return np.sort(np.concatenate(positions))
+
+
+def get_rungs(
+    model: str, preprocessor: str, X: pd.DataFrame, y: pd.Series, halving=False
+) -> list:
+    """Get the fidelities at which trials are evaluated, from the lowest.
+
+    Without halving, trials are only evaluated on all the rows with
+    `config.CV_SPLITTER`. With halving, the lower rungs use stratified fractions
+    of the rows (`HALVING_FRACTIONS`) and `HALVING_NUM_FOLDS` folds. The last rung
+    always uses all the rows, so that the final scores of both modes are the same.
+    """
+    fractions = sorted({*config.HALVING_FRACTIONS, 1.0}) if halving else [1.0]
+    rungs = []
+    for fraction in fractions:
+        if fraction >= 1:
+            n_folds = config.NUM_FOLDS
+            folds = list(config.CV_SPLITTER.split(X, y))
+            fold_spec = trials.get_fold_spec(model, preprocessor)
+        else:
+            # every class needs to be in every fold and in the early stopping set
+            # split from the training rows of each fold
+            n_folds = config.HALVING_NUM_FOLDS
+            min_count = math.ceil(
+                n_folds / (n_folds - 1) / config.EARLY_STOPPING_FRACTION
+            )
+            positions = subsample(y, fraction, min_count)
+            splitter = model_selection.StratifiedKFold(
+                n_splits=n_folds, shuffle=True, random_state=config.RANDOM_SEED
+            )
+            folds = [
+                (positions[train_idx], positions[val_idx])
+                for train_idx, val_idx in splitter.split(positions, y.iloc[positions])
+            ]
+            fold_spec = trials.get_fold_spec(
+                model, preprocessor, splitter, fraction=fraction
+            )
+            fraction = len(positions) / len(y)
+        rungs.append(
+            {
+                "fraction": fraction,
+                "n_folds": n_folds,
+                "folds": folds,
+                "fold_spec": fold_spec,
+            }
+        )
+    return rungs
+
+
+def is_promoted(trial: optuna.Trial, rung: int, value: float) -> bool:
+    """Check whether a trial is in the top `1 / HALVING_FACTOR` of its rung.
+
+    The trial is compared to the trials of the study that reached the rung so far,
+    like in asynchronous successive halving, so the first trial is always promoted.
+    """
+    values = [
+        other.intermediate_values[rung]
+        for other in trial.study.get_trials(deepcopy=False)
+        if other.number != trial.number and rung in other.intermediate_values
+    ]
+    values = sorted(
+        [*values, value],
+        reverse=trial.study.direction == optuna.study.StudyDirection.MAXIMIZE,
+    )
+    n_promoted = max(1, len(values) // config.HALVING_FACTOR)
+    return value in values[:n_promoted]
+
+
+def create_objective(
+    model: str, preprocessor: str, data_path, n_threads: int, halving=False
+):
+    """Create an objective that reports intermediate scores to the trial.
+
+    With halving, a trial is evaluated rung by rung and pruned as soon as it isn't
+    promoted. The rung, fidelity and budget of every trial are saved as its user
+    attributes, where the budget is the number of full evaluations it cost.
+    """
+    train_df = data.load_data(data_path)
+    X = train_df.drop(config.TARGET_COL, axis=1)
+    y = train_df[config.TARGET_COL]
+    data_hash = data.hash_frame(X, y)
+    rungs = get_rungs(model, preprocessor, X, y, halving)
+
+    # scores are negated for the study to minimize errors such as log loss
+    eval_metric = config.EVAL_METRICS[0]
+    sign = -1 if eval_metric.startswith("neg_") else 1
+
+    # boosted models report their iterations on the first fold instead of folds,
+    # unless the steps of the trial are the rungs
+    prune_iterations = boosting.supports_pruning(model) and not halving
+
+    @profiling.profile
+    def evaluate(trial: optuna.Trial, trial_params: dict, rung: dict) -> tuple:
+        """Cross-validate a configuration on the folds of a rung"""
+        scores, best_iterations, budget = [], [], 0.0
+        for fold, (train_idx, val_idx) in enumerate(rung["folds"]):
+            fold_results = cv.fit_fold(
+                model,
+                preprocessor,
+                X,
+                y,
+                train_idx,
+                val_idx,
+                data_hash,
+                trial_params,
+                early_stopping=True,
+                trial=trial if prune_iterations and fold == 0 else None,
+                n_threads=n_threads,
+            )
+            scores.append(fold_results[f"test_{eval_metric}"])
+            if "best_iteration" in fold_results:
+                best_iterations.append(fold_results["best_iteration"])
+            budget += rung["fraction"] / config.NUM_FOLDS
+
+            # stop hopeless trials early
+            if not halving and not prune_iterations:
+                trial.report(sign * np.mean(scores), step=fold)
+                if trial.should_prune():
+                    trial.set_user_attr("budget", budget)
+                    raise optuna.TrialPruned()
+
+        user_attrs = {}
+        if best_iterations:
+            user_attrs["best_iteration"] = int(np.mean(best_iterations))
+        return sign * np.mean(scores), user_attrs, budget
+
+    @profiling.profile
+    def objective(trial: optuna.Trial) -> float:
+        suggested_params = params.suggest_params(trial, model)
+        trial_params = params.strip_prefix(suggested_params)
+
+        budget = 0.0
+        for i, rung in enumerate(rungs):
+            trial.set_user_attr("rung", i)
+            trial.set_user_attr("fidelity", rung["fraction"])
+            trial.set_user_attr("n_folds", rung["n_folds"])
+
+            # configurations evaluated before, in any study, aren't evaluated again
+            key = trials.get_key(
+                model, preprocessor, suggested_params, rung["fold_spec"], data_hash
+            )
+            result = trials.get_result(key)
+            if result is None:
+                value, user_attrs, rung_budget = evaluate(trial, trial_params, rung)
+                budget += rung_budget
+                trials.save_result(
+                    key,
+                    model,
+                    preprocessor,
+                    suggested_params,
+                    rung["fold_spec"],
+                    data_hash,
+                    value,
+                    user_attrs,
+                )
+            else:
+                value, user_attrs = result["value"], result["user_attrs"]
+                trial.set_user_attr("cached", True)
+            for name, attr in user_attrs.items():
+                trial.set_user_attr(name, attr)
+            trial.set_user_attr("budget", budget)
+
+            # only the best trials of a rung are evaluated on the next one
+            if i < len(rungs) - 1:
+                trial.report(value, step=i)
+                if not is_promoted(trial, i, value):
+                    raise optuna.TrialPruned()
+        return value
 
-samplers = {
-    "tpe": optuna.samplers.TPESampler(),
-    "random": optuna.samplers.RandomSampler(),
-}
+    return objective
 
 
-@utils.timer
+def log_trials(study: optuna.Study, run_logger: tracking.RunLogger) -> None:
+    """Log the value, fidelity and budget of each trial, indexed by its number"""
+    budgets, rungs = [], []
+    for trial in study.get_trials(deepcopy=False):
+        if "budget" not in trial.user_attrs:
+            continue
+        metrics = {
+            "trial_fidelity": trial.user_attrs["fidelity"],
+            "trial_rung": trial.user_attrs["rung"],
+            "trial_budget": trial.user_attrs["budget"],
+        }
+        if trial.state == optuna.trial.TrialState.COMPLETE:
+            metrics["trial_value"] = trial.value
+        run_logger.log_metrics(metrics, step=trial.number)
+        budgets.append(trial.user_attrs["budget"])
+        rungs.append(trial.user_attrs["rung"])
+
+    # number of trials that reached each rung
+    metrics = {"total_budget": sum(budgets)}
+    for rung in range(max(rungs, default=-1) + 1):
+        metrics[f"rung_{rung}_trials"] = sum(reached >= rung for reached in rungs)
+    run_logger.log_metrics(metrics)
+
+
+@profiling.profile
+def run_worker(
+    study_name: str,
+    model: str,
+    preprocessor: str,
+    data_path,
+    sampler: str,
+    pruner: str,
+    n_trials: int,
+    timeout: float,
+    n_threads: int,
+    halving=False,
+) -> None:
+    """Run tuning trials against the shared study storage."""
+    config.configure_logging()
+
+    study = optuna.load_study(
+        study_name=study_name,
+        storage=config.OPTUNA_DATABASE_URL,
+        sampler=params.samplers[sampler](),
+        pruner=params.pruners[pruner](),
+    )
+    objective = create_objective(model, preprocessor, data_path, n_threads, halving)
+    study.optimize(objective, n_trials=n_trials, timeout=timeout)
+
+
+@profiling.profile
 def tune(
     model: str,
     preprocessor: str,
     n_trials: int,
     timeout: float,
     data_path="",
-    sampler=None,
+    sampler="random",
+    pruner="median",
+    n_workers=1,
+    n_cores=None,
+    halving=False,
 ) -> None:
-    """Tune a model's hyperparameters."""
+    """Tune a model's hyperparameters.
+
+    With `halving`, trials are first evaluated on small fractions of the rows and
+    only the best ones are evaluated on all of them, which replaces the pruner.
+    """
     # load data
     if not data_path:
         data_path = config.TRAIN_DATA
 
-    train_df = pd.read_csv(data_path, index_col=config.INDEX_COL)
+    if halving:
+        pruner = "none"
 
-    # separate features from target
-    X = train_df.drop(config.TARGET_COL, axis=1)
-    y = train_df[config.TARGET_COL]
-
-    # create pipeline
-    pipe = Pipeline(
-        [
-            (preprocessor, preprocessors.preprocessors[preprocessor]),
-            (model, models.models[model]),
-        ],
-        verbose=config.VERBOSE,
-    )
+    # split the cores between the workers and the models
+    allocation = scheduler.allocate(n_trials, n_cores, n_workers, name="trials")
+    n_workers, n_threads = allocation["workers"], allocation["threads"]
 
-    # obtain the hyperparameter space for the model
-    param_distributions = params.get_params(model)
+    # the study minimizes errors so that boosted models can report their losses
+    eval_metric = config.EVAL_METRICS[0]
+    metric_name = eval_metric.replace("neg_", "")
+    direction = "minimize" if eval_metric.startswith("neg_") else "maximize"
 
     tags = {"model": model, "preprocessor": preprocessor, "n_folds": config.NUM_FOLDS}
-    with mlflow.start_run(
+    with tracking.start_run(
         run_name=f"{model}+{preprocessor}+{config.NUM_FOLDS}",
         tags=tags,
-    ):
+    ) as run_logger:
         # create the study
         study = optuna.create_study(
             storage=config.OPTUNA_DATABASE_URL,
-            sampler=samplers.get(sampler),
-            direction="maximize",
-            study_name=f"{model}+{preprocessor}+{sampler}+{config.NUM_FOLDS}",
+            sampler=params.samplers[sampler](),
+            pruner=params.pruners[pruner](),
+            direction=direction,
+            study_name=(
+                f"{model}+{preprocessor}+{sampler}+{config.NUM_FOLDS}+{metric_name}"
+                + ("+halving" if halving else "")
+            ),
             load_if_exists=True,
         )
-        mlflow.set_tags({"study_name": study.study_name, "sampler": sampler})
-
-        # hyperparameter search
-        eval_metric = config.EVAL_METRICS[0]
-        optuna_search = optuna.integration.OptunaSearchCV(
-            pipe,
-            param_distributions,
-            study=study,
-            n_trials=n_trials,
-            timeout=timeout * 60,
-            cv=config.CV_SPLITTER,
-            scoring=eval_metric,
+
+        # add the configurations evaluated by other studies on the same data
+        train_df = data.load_data(data_path)
+        X = train_df.drop(config.TARGET_COL, axis=1)
+        y = train_df[config.TARGET_COL]
+        data_hash = data.hash_frame(X, y)
+        n_seeded = trials.seed_study(
+            study,
+            model,
+            preprocessor,
+            trials.get_fold_spec(model, preprocessor),
+            data_hash,
+        )
+        run_logger.log_metrics({"n_seeded_trials": n_seeded})
+        run_logger.set_tags(
+            {
+                "study_name": study.study_name,
+                "sampler": sampler,
+                "pruner": pruner,
+                "n_workers": n_workers,
+                "n_threads": n_threads,
+                "halving": halving,
+            }
         )
-        optuna_search.fit(X, y)
+
+        # hyperparameter search with workers sharing the study storage
+        worker_trials = np.array_split(np.arange(n_trials), n_workers)
+        worker_results = joblib.Parallel(n_jobs=n_workers)(
+            joblib.delayed(profiling.record)(
+                run_worker,
+                study.study_name,
+                model,
+                preprocessor,
+                data_path,
+                sampler,
+                pruner,
+                len(trial_ids),
+                timeout * 60,
+                n_threads,
+                halving,
+            )
+            for trial_ids in worker_trials
+            if len(trial_ids)
+        )
+        cache.evict()
+        for _, worker_spans in worker_results:
+            profiling.attach(worker_spans)
+
+        # reload the study to obtain the results of all the workers
+        study = optuna.load_study(
+            study_name=study.study_name, storage=config.OPTUNA_DATABASE_URL
+        )
+        log_trials(study, run_logger)
+
+        # use the number of iterations found by early stopping
+        best_params = dict(study.best_params)
+        best_iteration = study.best_trial.user_attrs.get("best_iteration")
+        if best_iteration is not None:
+            best_params[f"{model}__{boosting.iteration_params[model]}"] = best_iteration
+            run_logger.log_metrics({"best_iteration": best_iteration})
 
         # log the best parameters
-        for param, value in optuna_search.best_params_.items():
-            mlflow.log_param(param, value)
+        run_logger.log_params(best_params)
 
         # log the best score
-        best_score = optuna_search.best_score_
-        metrics = {eval_metric: best_score}
-        if "neg_" in eval_metric:
-            metrics[eval_metric.replace("neg_", "")] = -best_score
-            metrics.pop(eval_metric)
-
-        mlflow.log_metrics(metrics)
+        run_logger.log_metrics({metric_name: study.best_value})
 
-        # save the best model
-        mlflow.sklearn.log_model(optuna_search.best_estimator_, "model")
+        # refit and save the best model
+        pipe = Pipeline(
+            [
+                (preprocessor, preprocessors.preprocessors[preprocessor]),
+                (model, models.models[model]),
+            ],
+            verbose=config.VERBOSE,
+        )
+        pipe.set_params(**best_params)
+        with profiling.span("refit"):
+            X_transformed = pipe[:-1].fit_transform(X, y)
+            densifier = cv.get_densifier(model, X_transformed)
+            if densifier is not None:
+                X_transformed = densifier.transform(X_transformed)
+                pipe.steps.insert(-1, ("densify", densifier))
+            categorical_params = models.get_categorical_params(
+                model, pipe[-1], X_transformed
+            )
+            pipe[-1].set_params(**categorical_params).fit(X_transformed, y)
+        run_logger.log_model(pipe, "model")
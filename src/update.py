@@ -0,0 +1,129 @@
+import logging
+import time
+
+import mlflow
+import numpy as np
+from sklearn.metrics import get_scorer, log_loss
+from sklearn.model_selection import StratifiedKFold
+from sklearn.pipeline import Pipeline
+
+from . import (
+    boosting,
+    config,
+    data,
+    profiling,
+    tracking,
+    train,
+    transformers,
+    utils,
+)
+
+# logger
+logger = logging.getLogger(__name__)
+
+
+def score(estimator: Pipeline, X, y, metric: str) -> float:
+    """Score a pipeline with an evaluation metric.
+
+    The log loss is given the classes of the model, since a fold's share of the new
+    data can miss some of them.
+    """
+    if metric == "neg_log_loss":
+        return -log_loss(y, estimator.predict_proba(X), labels=estimator.classes_)
+    return get_scorer(metric)(estimator, X, y)
+
+
+@profiling.profile
+def update_fold(
+    model: str, estimator: Pipeline, X, y, train_idx, val_idx, n_iterations: int
+) -> dict:
+    """Train a fold pipeline further on its share of the new data"""
+    X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
+    y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
+    preprocessing, fold_model = estimator[:-1], estimator[-1]
+
+    # score the parent model before it's updated
+    results = {}
+    for metric in config.EVAL_METRICS:
+        results[f"parent_test_{metric}"] = score(estimator, X_val, y_val, metric)
+
+    start_time = time.perf_counter()
+    with profiling.span("preprocess"):
+        results["n_new_categories"] = transformers.extend_categories(
+            preprocessing[0], X_train
+        )
+        X_train_transformed = preprocessing.transform(X_train)
+    with profiling.span("fit"):
+        fold_model = boosting.continue_fit(
+            model, fold_model, X_train_transformed, y_train, n_iterations
+        )
+    estimator.steps[-1] = (estimator.steps[-1][0], fold_model)
+    results["fit_time"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with profiling.span("score"):
+        for metric in config.EVAL_METRICS:
+            results[f"test_{metric}"] = score(estimator, X_val, y_val, metric)
+            results[f"train_{metric}"] = score(estimator, X_train, y_train, metric)
+    results["score_time"] = time.perf_counter() - start_time
+    return results
+
+
+@profiling.profile
+def update(run_id: str, data_path, n_iterations=100) -> None:
+    """Train the fold models of a run further on new data."""
+    parent_run = mlflow.get_run(run_id)
+    model = parent_run.data.tags["model"]
+    preprocessor = parent_run.data.tags["preprocessor"]
+    if not boosting.supports_warm_start(model):
+        raise ValueError(f"Incremental training is not supported for {model!r}")
+    if parent_run.data.tags.get("out_of_core"):
+        raise ValueError(
+            f"Incremental training of run {run_id!r} is not supported, as it was "
+            f"trained out of core"
+        )
+
+    # load the new data
+    delta_df = data.load_data(data_path)
+    X = delta_df.drop(config.TARGET_COL, axis=1)
+    y = delta_df[config.TARGET_COL]
+
+    # each fold model is trained further on its own split of the new data
+    estimators = utils.load_models(run_id)
+    splitter = StratifiedKFold(
+        n_splits=len(estimators), shuffle=True, random_state=config.RANDOM_SEED
+    )
+
+    tags = {
+        "model": model,
+        "preprocessor": preprocessor,
+        "n_folds": len(estimators),
+        "mlflow.parentRunId": run_id,
+        "parent_run_id": run_id,
+    }
+    with tracking.start_run(
+        run_name=f"{model}+{preprocessor}+{len(estimators)}+update",
+        tags=tags,
+    ) as run_logger:
+        run_logger.log_params(
+            {"data_path": str(data_path), "n_iterations": n_iterations}
+        )
+
+        fold_results = [
+            update_fold(model, estimator, X, y, train_idx, val_idx, n_iterations)
+            for estimator, (train_idx, val_idx) in zip(estimators, splitter.split(X, y))
+        ]
+        cv_results = {
+            key: np.array([result[key] for result in fold_results])
+            for key in fold_results[0]
+        }
+
+        # log the number of categories added to the encoders
+        n_new_categories = cv_results.pop("n_new_categories")
+        run_logger.log_metrics({"n_new_categories": n_new_categories.sum()})
+
+        # log metrics
+        train.log_metrics(cv_results, run_logger)
+
+        # save the models
+        train.save_models(estimators, run_logger)
@@ -1,28 +1,17 @@
+import ast
 import functools
 import logging
-import time
 
+import joblib
 import mlflow
 
-from . import config
+from . import config, profiling
 
 # logger
 logger = logging.getLogger(__name__)
 
-
-def timer(func):
-    """Print the runtime of the decorated function"""
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start_time = time.perf_counter()
-        value = func(*args, **kwargs)
-        end_time = time.perf_counter()
-        run_time = end_time - start_time
-        logger.info(f"Finished {func.__name__!r} in {run_time:.4f} seconds")
-        return value
-
-    return wrapper
+# local cache of models logged to MLflow
+model_cache = joblib.Memory(config.MODEL_CACHE_DIR, verbose=0)
 
 
 def configure_mlflow(
@@ -44,18 +33,67 @@ def configure_mlflow(
     return wrapper
 
 
-def load_model(run_id, model_name="model"):
-    """Load a scikit-learn model from a given run ID and model name"""
+@model_cache.cache
+def _load_model(run_id: str, model_name: str):
+    """Load a scikit-learn model from MLflow"""
+    logger.info(f"Loading {model_name!r} of run {run_id!r} from MLflow")
     return mlflow.sklearn.load_model(f"runs:/{run_id}/{model_name}")
 
 
-def load_models(run_id: str) -> list:
+@model_cache.cache
+def get_n_folds(run_id: str) -> int:
+    """Get the number of folds of a given run ID"""
+    return int(mlflow.get_run(run_id).data.tags["n_folds"])
+
+
+def _get_model(run_id: str, model_name: str):
+    """Get a model from the local cache, loading it from MLflow if it's missing"""
+    # the model is always read from the local cache, so that it's identical, e.g.
+    # for hashing, whether it was just downloaded or not
+    return _load_model.call_and_shelve(run_id, model_name).get()
+
+
+def evict_models() -> None:
+    """Evict the least recently used models from the local cache"""
+    model_cache.reduce_size(bytes_limit=config.MODEL_CACHE_SIZE)
+
+
+def load_model(run_id, model_name="model"):
+    """Load a scikit-learn model from a given run ID and model name.
+
+    Models are cached locally, so that repeat loads skip MLflow.
+    """
+    model = _get_model(run_id, model_name)
+    evict_models()
+    return model
+
+
+@profiling.profile
+def load_models(run_id: str, n_jobs=-1) -> list:
     """Load all models from a given run ID"""
     # get the number of folds for this run
-    n_folds = int(mlflow.get_run(run_id).data.tags["n_folds"])
-
-    # load models
-    models = []
-    for fold in range(n_folds):
-        models.append(load_model(run_id, f"model_{fold}"))
+    n_folds = get_n_folds(run_id)
+
+    # load models concurrently to overlap their I/O, and evict old models once
+    # they are all loaded
+    models = joblib.Parallel(n_jobs=n_jobs, prefer="threads")(
+        joblib.delayed(_get_model)(run_id, f"model_{fold}") for fold in range(n_folds)
+    )
+    evict_models()
     return models
+
+
+def load_params(run_id: str, model: str) -> dict:
+    """Load the hyperparameters of a model logged in a given run ID"""
+    params = {}
+    for param, value in mlflow.get_run(run_id).data.params.items():
+        if not param.startswith(f"{model}__"):
+            continue
+
+        # MLflow stores parameters as strings
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+        params[param] = value
+    return params